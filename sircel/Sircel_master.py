@@ -4,7 +4,7 @@ Pachter and Doudna groups
 """
 
 
-from sircel.utils import IO_utils, Plot_utils
+from sircel.utils import IO_utils, Plot_utils, Column_utils
 from sircel import Split_reads
 import argparse
 import os
@@ -44,13 +44,6 @@ def run_all(args):
 		args['umi_end'] 			= 20	
 		if args['kmer_size'] == None:
 			args['kmer_size'] = 8
-		print('Unzipping files (temporary)')
-		reads_unzipped = \
-			IO_utils.unzip(args['reads'].split(','))
-		barcodes_unzipped = \
-			IO_utils.unzip(args['barcodes'].split(','))
-		args['reads'] = reads_unzipped
-		args['barcodes'] = barcodes_unzipped
 		
 	elif args['10xgenomics']:
 		args['barcode_start']	= 0
@@ -59,28 +52,39 @@ def run_all(args):
 		args['umi_end'] 			= 34
 		if args['kmer_size'] == None:
 			args['kmer_size'] = 20	
-		print('Unzipping and merging files (temporary)')
-		reads_unzipped = \
-			IO_utils.unzip(args['reads'].split(','))
-		barcodes_unzipped = IO_utils.merge_barcodefiles_10x(
-			args['barcodes'].split(','),
-			args['umis'].split(','))
-				
-		args['reads'] = reads_unzipped
-		args['barcodes'] = barcodes_unzipped	
+		print('Merging barcode and UMI files (streaming)')
 
 	else:
 		if args['kmer_size'] == None:
 			args['kmer_size'] = 8
-		print('Unzipping (temporary)')
-		reads_unzipped = \
-			IO_utils.unzip(args['reads'].split(','))
-		barcodes_unzipped = \
-			IO_utils.unzip(args['barcodes'].split(','))
-		args['reads'] = reads_unzipped
-		args['barcodes'] = barcodes_unzipped
+	if not args['10xgenomics']:
+		args['umis'] = None#only 10x genomics barcodes are merged with umis
+	
+	print('Indexing inputs')
+	args['reads_index'] = IO_utils.index_fastq(
+		args['reads'], 
+		'%s/reads_index.npy' % args['output_dir'],
+		threads = args['threads'])
+	args['barcodes_index'] = IO_utils.index_fastq(
+		args['barcodes'], 
+		'%s/barcodes_index.npy' % args['output_dir'],
+		args['umis'],
+		args['threads'])
 	
 	check_split_input(args)
+	args['columns'] = None
+	if args['barcode_columns']:
+		print('Extracting barcode and UMI columns')
+		with IO_utils.open_fastq(
+			args['barcodes'], umi_fnames = args['umis']) as fq:
+			args['columns'] = Column_utils.build_columns(
+				fq,
+				len(IO_utils.load_record_index(args['barcodes_index'])),
+				'%s/columns' % args['output_dir'],
+				args['barcode_start'],
+				args['barcode_end'],
+				args['umi_start'],
+				args['umi_end'])
 	output_files, elapsed_time = Split_reads.run_all(args)
 	output_files['args'] = args
 	print('Done idetifying barcodes and splitting reads.\n' + \
@@ -103,9 +107,6 @@ def run_all(args):
 			output_files,
 			kallisto_dir)
 				
-	print('Removing temp files')
-	os.unlink(reads_unzipped)
-	os.unlink(barcodes_unzipped)
 	output_files['run_outputs'] = \
 		'%s/run_outputs.json' % args['output_dir']
 	with open(output_files['run_outputs'], 'w') as writer:
@@ -231,10 +232,16 @@ def check_split_input(args):
 	assert args['umi_start'] <= args['umi_end'], \
 		'UMI end position %i is less than start position %i' % \
 		(args['umi_end'], args['umi_start'])	
-	assert os.path.exists(args['reads']), \
-		'Cannot find reads file %s' % args['reads']	
-	assert os.path.exists(args['barcodes']), \
-		'Cannot find barcodes file %s' % args['barcodes']
+	for fname in args['reads'].split(','):
+		assert os.path.exists(fname), \
+			'Cannot find reads file %s' % fname
+	for fname in args['barcodes'].split(','):
+		assert os.path.exists(fname), \
+			'Cannot find barcodes file %s' % fname
+	if args['umis'] is not None:
+		for fname in args['umis'].split(','):
+			assert os.path.exists(fname), \
+				'Cannot find umis file %s' % fname
 	assert args['kmer_size'] > 0, \
 		'Kmer size must be positve. %i' % args['kmer_size']
 
@@ -297,6 +304,70 @@ def get_args(args=None):
 		type=int,
 		help='Estimated number of cells.',
 		default=None)
+	parser.add_argument('--bytes_mode',
+		help='Keep sequences as bytes instead of decoding them to str. ' + \
+			'Output is identical; saves decoding / encoding every read',
+		action='store_true')
+	parser.add_argument('--sharded',
+		help='Split the indexed inputs into ranges of records that ' + \
+			'worker processes read and parse themselves. Output is identical',
+		action='store_true')
+	parser.add_argument('--kmer_index_cache',
+		type=str,
+		help='Directory for cached kmer indices. A rerun with the same ' + \
+			'inputs, kmer size and barcode coordinates reuses the index ' + \
+			'(default: output_dir)',
+		default=None)
+	parser.add_argument('--kmer_sketch_mb',
+		type=int,
+		help='Count kmers approximately, in a count-min sketch of this ' + \
+			'many MB, and index only kmers seen at least 3 times. For very ' + \
+			'deep libraries (default: exact counts)',
+		default=None)
+	parser.add_argument('--kmer_bloom_mb',
+		type=int,
+		help='Only index kmers seen at least twice, using a bloom filter ' + \
+			'of this many MB to remember kmers seen once. Most sequencing ' + \
+			'error kmers are never indexed (default: index every kmer)',
+		default=None)
+	parser.add_argument('--graph_backend',
+		type=str,
+		choices=['objects', 'arrays'],
+		help='Build barcode subgraphs from Edge objects, or as integer ' + \
+			'arrays with CSR adjacency (ArrayGraph). Both find the same ' + \
+			'cycles (default: objects)',
+		default='objects')
+	parser.add_argument('--cycle_search',
+		type=str,
+		choices=['dfs', 'dp'],
+		help='Find cycles by depth first search, or find the exact ' + \
+			'maximum bottleneck cycle through each seed by dynamic ' + \
+			'programming (polynomial time, no recursion; uses the arrays ' + \
+			'graph backend) (default: dfs)',
+		default='dfs')
+	parser.add_argument('--barcode_columns',
+		help='Extract the barcode and UMI of every read into fixed width ' + \
+			'arrays (memory mapped, shared by worker processes) once, and ' + \
+			'build subgraphs and assign reads from them instead of ' + \
+			're-reading fastq records',
+		action='store_true')
+	parser.add_argument('--skip_explained_seeds',
+		help='Search seed kmers in rounds, and defer a seed to the end ' + \
+			'of the queue when a cycle found in an earlier round passes ' + \
+			'through it (or through a kmer one substitution away) with 3 ' + \
+			'times the seed count',
+		action='store_true')
+	parser.add_argument('--adaptive_breadth',
+		help='Search seed kmers in rounds, by decreasing count, and stop ' + \
+			'after a round whose paths all weigh less than a quarter of ' + \
+			'the running estimate of the knee of the path weight curve. ' + \
+			'--breadth is ignored',
+		action='store_true')
+	parser.add_argument('--global_graph',
+		help='Build one de Bruijn graph of all sampled kmers, weighted ' + \
+			'by their counts, and search a view of it from each seed, ' + \
+			'instead of re-reading the reads of every seed into a subgraph',
+		action='store_true')
 	
 	parser.add_argument(
 		'--barcode_start',
@@ -5,8 +5,8 @@ Pachter and Doudna groups
 
 Split reads for dropseq data
 1. Index kmers
-		Produce a dict kmer_index 
-		kmer_index[kmer] -> list of read line numbers that contain this kmer
+		Produce a kmer_index (Kmer_utils.KmerIndex)
+		kmer_index.get_postings(kmer) -> offsets of reads that contain this kmer
 2. Find cyclic paths
 		pick a popular kmer
 		get all reads that contain the kmer
@@ -22,7 +22,6 @@ import os
 import sys
 import time
 import json
-import gc
 import numpy as np
 
 from collections import Counter, namedtuple
@@ -31,14 +30,17 @@ from multiprocessing import Pool
 from Levenshtein import distance, hamming
 from scipy import signal
  
-from sircel.utils import IO_utils, Plot_utils, Logger
-from sircel.utils.Graph_utils import Edge, Graph, Path
+from sircel.utils import IO_utils, Kmer_utils, Plot_utils, Logger, Column_utils
+from sircel.utils.Assignment_utils import AssignmentStore
+from sircel.utils.Graph_utils import Edge, Graph, Path, ArrayGraph
 
-np.random.seed(0)
+RANDOM_SEED = 0
+np.random.seed(RANDOM_SEED)
 
 args = {}
 output_files = {}
 output_dir = ''
+_global_graphs = {}
 
 def run_all(cmdline_args):
 	print('Splitting reads by barcodes')
@@ -57,14 +59,15 @@ def run_all(cmdline_args):
 	reads_unzipped = args['reads']
 	barcodes_unzipped = args['barcodes']
 	print('Building kmer index')
-	kmer_index, kmer_counts, subsamp_pearson = get_kmer_index(barcodes_unzipped)
+	kmer_index, subsamp_pearson = get_kmer_index(
+		barcodes_unzipped, 
+		IO_utils.load_record_index(args['barcodes_index']))
 	output_files['subsamp_pearson_plot'] = subsamp_pearson
-	print('\t%i unique kmers indexed' % len(kmer_counts.items()))
+	print('\t%i unique kmers indexed' % kmer_index.get_num_kmers())
 	
 	print('Finding cyclic paths in the barcode de Briujn graph')
 	cyclic_paths = find_paths(
 		(kmer_index,
-		kmer_counts,
 		barcodes_unzipped, 
 		reads_unzipped,
 		output_dir))	
@@ -79,7 +82,7 @@ def run_all(cmdline_args):
 	consensus_bcs = set([tup[0] for tup in top_paths])
 	
 	print('Assigning reads')
-	reads_assigned_db, reads_assigned_pipe = assign_all_reads(
+	reads_assigned = assign_all_reads(
 		(consensus_bcs,
 		reads_unzipped, 
 		barcodes_unzipped))
@@ -87,11 +90,11 @@ def run_all(cmdline_args):
 	print('Splitting reads by cell')
 	output_files['split'], reads_per_cell = write_split_fastqs(
 		(consensus_bcs,
-		reads_assigned_db, 
-		reads_assigned_pipe,
+		reads_assigned,
 		output_dir,
 		reads_unzipped,
 		barcodes_unzipped))
+	reads_assigned.close()
 	
 	#update paths list
 	top_paths = update_paths_list(top_paths, reads_per_cell)
@@ -104,17 +107,24 @@ def run_all(cmdline_args):
 	Logger.stop()
 	return(output_files, elapsed_time)
 	
-def get_kmer_index(barcodes_unzipped):
+def open_barcodes(barcodes_unzipped, threads = 1):
+	"""
+	Opens the barcodes fq. For 10x genomics data, the cell barcode and UMI
+	files are merged on the fly (see Merge_utils)
+	"""
+	return IO_utils.open_fastq(barcodes_unzipped, threads, args.get('umis'))
+
+def get_kmer_index(barcodes_unzipped, barcodes_index):
 	"""
 	Args:
-		barcodes_unzipped (str): filename for unzipped barcodes fq
+		barcodes_unzipped (str): filename(s) for barcodes fq (may be gzipped)
+		barcodes_index (np.array): record start offsets for barcodes fq
 	
 	Returns
-		kmer_idx (dict): map of kmer to list of line offsets for reads 
-			that contain that kmer
-		kmer_counts (dict): map of kmer to absolute counts
+		kmer_idx (Kmer_utils.KmerIndex): kmer counts, and offsets of the 
+			reads that contain each kmer
 	
-	This method returns a kmer index and counts dict for a random
+	This method returns a kmer index for a random
 	subset of the dataset. The size of the subset attempts to be the
 	minimal number of reads whose kmer spectrum is representative
 	of the data
@@ -134,20 +144,53 @@ def get_kmer_index(barcodes_unzipped):
 	PEARSONR_CUTOFF = 0.999
 	MIN_ITERS = 10
 	BUFFER_SIZE = 10000
+	SKETCH_MIN_COUNT = 3
+	
+	cache_key = get_kmer_index_cache_key(
+		barcodes_unzipped, 
+		(PEARSONR_CUTOFF, MIN_ITERS, BUFFER_SIZE, 
+			args.get('kmer_sketch_mb'), SKETCH_MIN_COUNT, 
+			args.get('kmer_bloom_mb')))
+	cache_dir = get_kmer_index_cache_dir(cache_key)
+	if os.path.exists('%s/key.json' % cache_dir):
+		print('\tUsing cached kmer index %s' % cache_dir)
+		return load_kmer_index_cache(cache_dir)
 	
-	length = args['barcode_end'] - args['barcode_start']
 	pool = Pool(processes = args['threads'])
 	
 	read_count = 0
-	kmer_idx = {}
+	sketch = None
+	min_count = 1
+	if args.get('kmer_sketch_mb') is not None:
+		#approximate counts in fixed memory. only kmers seen at least 
+		#SKETCH_MIN_COUNT times (mostly not sequencing errors) are indexed,
+		#with all their postings, so the index itself is not bounded
+		sketch = Kmer_utils.CountMinSketch(
+			args['kmer_sketch_mb'] * 2**20, seed = RANDOM_SEED)
+		min_count = SKETCH_MIN_COUNT
+	bloom = None
+	if args.get('kmer_bloom_mb') is not None:
+		#kmers are indexed from their second sighting on. most sequencing
+		#error kmers are seen once, and only ever reach the bloom filter
+		bloom = Kmer_utils.BloomFilter(
+			args['kmer_bloom_mb'] * 2**20, seed = RANDOM_SEED + 1)
+	kmer_idx = Kmer_utils.KmerIndex(
+		args['kmer_size'], sketch = sketch, min_count = min_count, bloom = bloom)
 	counts_corr_coefs = []
 	num_reads = []	
 	
-	bc_file = open(barcodes_unzipped, 'rb')
-	read_chunks_iter = IO_utils.get_read_chunks(
+	bc_file = open_barcodes(barcodes_unzipped)
+	if args['sharded'] or args.get('columns') is not None:
+		#workers read their own records. only record numbers are sent
+		read_chunks_iter = IO_utils.get_random_records(
+			len(barcodes_index), BUFFER_SIZE)
+	else:
+		read_chunks_iter = IO_utils.get_read_chunks(
 			bc_file,
 			random = True,
-			BUFFER_SIZE = BUFFER_SIZE)
+			BUFFER_SIZE = BUFFER_SIZE,
+			record_index = barcodes_index,
+			decode = not args['bytes_mode'])
 	chunk_num = 0
 	while True:
 		try:
@@ -159,26 +202,17 @@ def get_kmer_index(barcodes_unzipped):
 		read_count += len(reads_chunk)
 		num_reads.append(read_count)
 		chunk_kmer_indices = pool.map(
-			index_read,
-			reads_chunk)
-			#chunk_kmer_indices is a list of dicts
-		old_kmer_counts = get_kmer_counts(kmer_idx)
-			#kmer counts before updating with chunk_kmer_indexes
-		
-		for element in chunk_kmer_indices:
-			for(key, read_offsets) in element.items():
-				#read_offsets: [offset1, offset2, offset3 ...]
-				if key not in kmer_idx:
-					kmer_idx[key] = []
-				kmer_idx[key] = kmer_idx[key] + read_offsets
-		
+			index_records if (args['sharded'] or \
+				args.get('columns') is not None) else index_reads,
+			IO_utils.split_list(reads_chunk, args['threads']))
+			#chunk_kmer_indices is a list of (codes, offsets) arrays
+		kmer_idx.add(
+			np.concatenate([tup[0] for tup in chunk_kmer_indices]),
+			np.concatenate([tup[1] for tup in chunk_kmer_indices]))
 		del(chunk_kmer_indices)
-		_ = gc.collect()
 		
-		new_kmer_counts = get_kmer_counts(kmer_idx)
-		#check kmer count correlation
-		counts_corr_coef = get_kmer_count_correlation(
-			old_kmer_counts, new_kmer_counts)
+		#kmer count correlation before and after adding this chunk
+		counts_corr_coef = kmer_idx.count_correlation
 		counts_corr_coefs.append(counts_corr_coef)
 		print('\t%i reads indexed. Running pearsonr is %f' % \
 			(read_count, counts_corr_coef))
@@ -190,116 +224,304 @@ def get_kmer_index(barcodes_unzipped):
 	bc_file.close()
 	pool.close()
 	
+	kmer_idx.save(cache_dir)
+	save_kmer_index_cache(cache_dir, cache_key, counts_corr_coefs, num_reads)
+	return load_kmer_index_cache(cache_dir)
+
+def get_kmer_index_cache_key(barcodes_unzipped, sampling_params):
+	"""
+	Returns dict
+		everything the sampled kmer index depends on: the barcodes (and 
+		umis) files, by path, size and modification time, the kmer size,
+		barcode coordinates, random seed and sampling parameters
+	"""
+	fnames = barcodes_unzipped.split(',')
+	if args.get('umis') is not None:
+		fnames += args['umis'].split(',')
+	return {
+		'inputs' : [(os.path.abspath(fname), 
+			os.path.getsize(fname), 
+			os.path.getmtime(fname)) for fname in fnames],
+		'kmer_size' : args['kmer_size'],
+		'barcode_start' : args['barcode_start'],
+		'barcode_end' : args['barcode_end'],
+		'random_seed' : RANDOM_SEED,
+		'sampling' : list(sampling_params),
+		'version' : Kmer_utils.KMER_INDEX_VERSION}
+
+def get_kmer_index_cache_dir(cache_key):
+	"""
+	Returns the directory for the kmer index with this key, in 
+		args['kmer_index_cache'] (or output_dir)
+	"""
+	import hashlib
+	
+	cache_root = args.get('kmer_index_cache') or output_dir
+	key_hash = hashlib.sha1(
+		json.dumps(cache_key, sort_keys = True).encode('utf-8')).hexdigest()
+	return '%s/kmer_index_%s' % (cache_root, key_hash[0:16])
+
+def save_kmer_index_cache(cache_dir, cache_key, counts_corr_coefs, num_reads):
+	"""
+	Saves what a rerun needs besides the index arrays. The random state 
+	after sampling is kept, so that a cached run continues with the same 
+	random numbers as the run that built the index. key.json is written
+	last, and marks the cache as complete
+	"""
+	import pickle
+	
+	with open('%s/sampling.json' % cache_dir, 'w') as writer:
+		writer.write(json.dumps({
+			'counts_corr_coefs' : [float(i) for i in counts_corr_coefs],
+			'num_reads' : num_reads}))
+	with open('%s/random_state.pkl' % cache_dir, 'wb') as writer:
+		pickle.dump(np.random.get_state(), writer)
+	with open('%s/key.json' % cache_dir, 'w') as writer:
+		writer.write(json.dumps(cache_key, indent = 3))
+
+def load_kmer_index_cache(cache_dir):
+	"""
+	Returns
+		(kmer_index, subsampling plot) as get_kmer_index
+		The index arrays are memory mapped; workers attach to them by 
+		directory name instead of receiving postings
+	"""
+	import pickle
+	
+	with open('%s/sampling.json' % cache_dir) as reader:
+		sampling = json.load(reader)
+	with open('%s/random_state.pkl' % cache_dir, 'rb') as reader:
+		np.random.set_state(pickle.load(reader))
+	kmer_idx = Kmer_utils.load_kmer_index(cache_dir, args['kmer_size'])
 	return (kmer_idx, 
-		new_kmer_counts,
 		Plot_utils.plot_kmer_subsamp_pearson(
 			output_dir,
-			counts_corr_coefs,
-			num_reads))
+			sampling['counts_corr_coefs'],
+			sampling['num_reads']))
 
-def index_read(params):
+def index_reads(reads_chunk):
 	"""
 	Args
-		params (tuple):
-			barcodes_data (str): sequence of read_1 (barcode)
-			barcodes_offset (int): line offset for this read
+		reads_chunk (list): (barcodes_data, barcodes_offset) tuples
+			barcodes_data (list): fastq entry for read_1 (barcode)
+			barcodes_offset (int): byte offset for this read
 	Returns
-		kmer_index (dict): 
+		codes (np.array): cyclic kmer codes of all reads in the chunk
+		offsets (np.array): offset of the read each code came from
 	"""
-	(barcodes_data, barcodes_offset) = params
-	
-	kmer_index = {}
-	read_kmers = IO_utils.get_cyclic_kmers(
-		barcodes_data, 
-		args['kmer_size'],
-		args['barcode_start'], 
+	if len(reads_chunk) == 0:
+		return (np.zeros(0, dtype = Kmer_utils.get_dtype(args['kmer_size'])),
+			np.zeros(0, dtype = np.int64))
+	barcodes = Kmer_utils.get_barcode_array(
+		[tup[0] for tup in reads_chunk],
+		args['barcode_start'],
 		args['barcode_end'])
-	for(kmer, _) in read_kmers:
-		if(kmer not in kmer_index.keys()):
-			kmer_index[kmer] = []
-		kmer_index[kmer].append(barcodes_offset)
-	return kmer_index
+	codes, rows = Kmer_utils.get_cyclic_kmer_codes_batch(
+		barcodes, args['kmer_size'])
+	offsets = np.array([tup[1] for tup in reads_chunk], dtype = np.int64)
+	return codes, offsets[rows]
 
-def get_kmer_counts(kmer_idx):
+def index_records(records):
 	"""
+	Args
+		records (np.array): sorted record numbers in the barcodes fq
+	Returns
+		(codes, offsets) as for index_reads
 	
-	
+	Used in sharded mode. The worker reads and parses its own records, so 
+	only record numbers and kmer codes pass between processes. With 
+	barcode columns, the records are rows of the barcodes column instead
 	"""
-	kmer_counts = {}
-	for kmer, offsets in kmer_idx.items():
-		kmer_counts[kmer] = len(offsets)
-	return kmer_counts
+	record_index = IO_utils.load_record_index(args['barcodes_index'])
+	if args.get('columns') is not None:
+		if len(records) == 0:
+			return index_reads([])
+		codes, rows = Kmer_utils.get_cyclic_kmer_codes_batch(
+			Column_utils.load_column(args['columns'], 'barcodes')[records],
+			args['kmer_size'])
+		return codes, record_index[records].astype(np.int64)[rows]
+	bc_file = open_barcodes(args['barcodes'])
+	reads_chunk = list(IO_utils.read_fastq_random(
+		bc_file,
+		offsets = record_index[records[::-1]].tolist(),
+		decode = not args['bytes_mode']))
+	bc_file.close()
+	return index_reads(reads_chunk)
 
-def get_kmer_count_correlation(kmer_counts_a, kmer_counts_b):
-	from scipy.stats.stats import pearsonr
-	
-	common_elements = kmer_counts_a.keys() & kmer_counts_b.keys()
-	if(len(common_elements) <= 1):
-		return 0
-	
-	x = []
-	y = []
-	for element in common_elements:
-		x.append(kmer_counts_a[element])
-		y.append(kmer_counts_b[element])
-	
-	corr_coef, pval = pearsonr(x, y)
-	return corr_coef
-	
 def find_paths(params, starting_kmers = None):
+	CHUNKS_PER_THREAD = 8
+	SEEDS_PER_ROUND_PER_THREAD = 32
+	EXPLAINED_RATIO = 3
+	KNEE_WINDOW_LEN = 50
+	KNEE_FRACTION = 0.25
+	
 	(	kmer_index,
-		kmer_counts,
 		barcodes_unzipped, 
 		reads_unzipped,
 		output_dir) = params
 	barcode_length = args['barcode_end'] - args['barcode_start']
-	kmers_sorted = [tup[0] for tup in sorted(
-		list(kmer_counts.items()),
-		key = lambda tup: tup[1],
-		reverse = True)]
+	kmers_sorted = kmer_index.get_most_common().tolist()
 	
 	if(starting_kmers == None):
 		starting_kmers = []
 		for kmer in kmers_sorted:
-			if(kmer[0] == '$'):
-				starting_kmers.append((kmer, kmer_index[kmer]))
-			if(len(starting_kmers) >= args['breadth']):
+			if(Kmer_utils.is_sentinel_kmer(kmer, args['kmer_size'])):
+				starting_kmers.append(kmer)
+			if(len(starting_kmers) >= args['breadth'] and 
+				not args.get('adaptive_breadth')):
 				break	
-	else:
-		starting_kmers_tmp = []
-		for kmer in starting_kmers:
-			starting_kmers_tmp.append(kmer, kmer_index[kmer])
-		starting_kmers = starting_kmers_tmp
-		
 	
+	seed_counts = kmer_index.get_counts(starting_kmers)
+	seed_costs = kmer_index.get_num_postings(starting_kmers)
+	round_size = max(len(starting_kmers), 1)
+	if args.get('skip_explained_seeds') or args.get('adaptive_breadth'):
+		round_size = SEEDS_PER_ROUND_PER_THREAD * args['threads']
+	explained = None
+	if args.get('skip_explained_seeds'):
+		#seeds are searched in rounds, in order. a seed is deferred to the
+		#back of the queue when a cycle found in an earlier round passes 
+		#through a kmer one substitution away from it, with EXPLAINED_RATIO
+		#times the seed count: the seed is most likely a sequencing error of
+		#that barcode. deferred seeds are still searched, after all others
+		#(unless adaptive breadth stops the search first)
+		explained = {}
+	#with adaptive breadth, search stops after a round of seeds whose
+	#cycles all weigh less than KNEE_FRACTION of the estimated knee of
+	#the path weight curve (see get_knee_weight)
+	path_weights = {}
+	
+	if args.get('global_graph'):
+		get_global_graph(kmer_index.fname)
 	pool = Pool(processes = args['threads'])
-	paths = []
-	for group in IO_utils.grouper(
-		starting_kmers, args['threads']):
+	seed_paths = [[] for kmer in starting_kmers]
+	queue = list(range(len(starting_kmers)))
+	deferred = []
+	num_deferred = 0
+	searching_deferred = False
+	num_seeds = 0
+	while(len(queue) > 0):
+		seeds = np.array(queue[0:round_size], dtype = np.int64)
+		queue = queue[round_size:]
+		if explained is not None and not searching_deferred:
+			is_explained = np.array(
+				[get_explaining_weight(explained, starting_kmers[i]) >= \
+					EXPLAINED_RATIO * max(seed_counts[i], 1) \
+					for i in seeds.tolist()],
+				dtype = bool)
+			num_deferred += int(is_explained.sum())
+			deferred += seeds[is_explained].tolist()
+			seeds = seeds[~is_explained]
+			if(len(queue) == 0):
+				#deferred seeds are searched last, and not deferred again
+				searching_deferred = True
+				queue = deferred
+		if(len(seeds) == 0):
+			continue
+		num_seeds += len(seeds)
+		
+		#seeds are scheduled by estimated cost (number of reads in the 
+		#subgraph), costliest first, in chunks that workers pull as they 
+		#finish. paths are kept in seed order
+		chunks = IO_utils.get_cost_chunks(
+			seed_costs[seeds], CHUNKS_PER_THREAD * args['threads'])
+		round_weight = 0
+		for paths_chunk in pool.imap_unordered(find_paths_from_kmers, 
+			[[(i, (starting_kmers[i], 
+				kmer_index.fname, 
+				barcodes_unzipped, 
+				barcode_length)) for i in seeds[chunk].tolist()] \
+				for chunk in chunks]):
+			for (i, paths) in paths_chunk:
+				seed_paths[i] = paths
+				if explained is not None:
+					register_cycles(explained, paths)
+				for (seq, weight, _) in paths:
+					path_weights[seq] = max(path_weights.get(seq, 0), weight)
+					round_weight = max(round_weight, weight)
 		
-		kmers_group = [tup[0] for tup in group]
-		offsets_group = [tup[1] for tup in group]
-		paths_group = pool.map(find_path_from_kmer, zip(
-			kmers_group,
-			offsets_group,
-			repeat(barcodes_unzipped),
-			repeat(barcode_length)))
-		paths += [item for sublist in paths_group for item in sublist]
+		if args.get('adaptive_breadth'):
+			knee_weight = get_knee_weight(
+				list(path_weights.values()), KNEE_WINDOW_LEN)
+			if(knee_weight is not None and 
+				round_weight < KNEE_FRACTION * knee_weight):
+				print('\tStopped after %i of %i seeds. The last %i seeds ' \
+					'gave paths of weight at most %i, the knee is at %i' % \
+					(num_seeds, 
+					len(starting_kmers), 
+					len(seeds), 
+					round_weight, 
+					knee_weight))
+				break
 	pool.close()
-	return paths
+	if explained is not None:
+		print('\t%i of %i seeds (%.1f%%) deferred, explained by found ' \
+			'cycles. %i of %i seeds searched' % \
+			(num_deferred, 
+			len(starting_kmers), 
+			100.0 * num_deferred / max(len(starting_kmers), 1),
+			num_seeds,
+			len(starting_kmers)))
+	return [item for sublist in seed_paths for item in sublist]
+
+def get_explaining_weight(explained, kmer):
+	"""
+	Returns int
+		highest weight of a found cycle (see register_cycles) through kmer,
+		or through a kmer one substitution away from it. 0 if there is none
+	"""
+	return max([explained.get(code, 0) for code in \
+		[kmer] + Kmer_utils.get_substitution_codes(kmer, args['kmer_size'])])
+
+def register_cycles(explained, paths):
+	"""
+	Args
+		explained (dict): kmer code -> highest weight of a found cycle that
+			contains the kmer. Updated with paths
+		paths (list): (seq, weight, depth) tuples of cycles found from a
+			seed (see find_path_from_kmer)
+	"""
+	for (seq, weight, _) in paths:
+		#kmers of the cycle itself, '$' + seq, wrapping around
+		cycle = Kmer_utils.to_symbols('$' + seq)
+		for code in Kmer_utils.get_kmer_codes(
+			cycle + cycle[:args['kmer_size'] - 1], args['kmer_size']):
+			explained[code] = max(explained.get(code, 0), weight)
+
+def find_paths_from_kmers(chunk):
+	"""
+	Args
+		chunk (list): (seed number, params for find_path_from_kmer) tuples
+	Returns list
+		(seed number, paths) tuples
+	"""
+	return [(i, find_path_from_kmer(params)) for (i, params) in chunk]
 
 def find_path_from_kmer(params):
 	(	starting_kmer,
-		offsets, 
+		kmer_index_fname, 
 		barcodes_unzipped,
 		barcode_length) = params
 	#1. build subgraph
-	subgraph = build_subgraph(offsets, barcodes_unzipped)
+	if args.get('global_graph'):
+		kmer = Kmer_utils.decode_kmer(starting_kmer, args['kmer_size'])
+		subgraph = get_global_graph(kmer_index_fname).get_view(
+			kmer[0:-1], kmer[1:], barcode_length + 1)
+		if(subgraph is None):
+			return []
+	else:
+		offsets = Kmer_utils.load_kmer_index(
+			kmer_index_fname, args['kmer_size']).get_postings(starting_kmer)
+		subgraph = build_subgraph(offsets.tolist(), barcodes_unzipped)
 	#2. find paths
+	starting_kmer = Kmer_utils.decode_kmer(starting_kmer, args['kmer_size'])
 	node = starting_kmer[0:-1]
 	neighbor = starting_kmer[1:]
 	paths = []
-	paths_iter = subgraph.find_all_cyclic_paths(
+	if args.get('cycle_search') == 'dp':
+		paths_iter = subgraph.find_all_max_bottleneck_cycles(
+			node, neighbor, barcode_length + 1)
+	else:
+		paths_iter = subgraph.find_all_cyclic_paths(
 			node, neighbor, barcode_length + 1)
 	counter = 1
 	
@@ -319,28 +541,56 @@ def find_path_from_kmer(params):
 		counter += 1
 	return merge_paths(paths)
 
+def get_global_graph(kmer_index_fname):
+	"""
+	Returns ArrayGraph
+		the de Bruijn graph of all kmers of the sampled reads, weighted by
+		their counts in the kmer index. Seeds search views of it (see 
+		ArrayGraph.get_view) instead of subgraphs built from their reads
+	Built once per process. find_paths builds it before creating its Pool,
+	so the workers inherit it
+	"""
+	if kmer_index_fname not in _global_graphs:
+		kmer_index = Kmer_utils.load_kmer_index(
+			kmer_index_fname, args['kmer_size'])
+		_global_graphs[kmer_index_fname] = ArrayGraph(
+			kmer_index.codes, kmer_index.counts, args['kmer_size'])
+	return _global_graphs[kmer_index_fname]
+
 def build_subgraph(reads_in_subgraph, barcodes_unzipped):
-	bc_file = open(barcodes_unzipped, 'rb')
-	barcodes_iter = IO_utils.read_fastq_random(
-		bc_file, offsets = reads_in_subgraph)
-	subgraph_kmer_counts = Counter()
-	while(True):
-		try:
-			barcode_data, _ = next(barcodes_iter)
-		except StopIteration:
-			break	
-		read_kmers = IO_utils.get_cyclic_kmers(
-			barcode_data, 
-			int(args['kmer_size']),
-			int(args['barcode_start']), 
-			int(args['barcode_end']))		
-		for (kmer, _ ) in read_kmers:
-			subgraph_kmer_counts[kmer] += 1
-	bc_file.close()
+	if args.get('columns') is not None:
+		#offsets are looked up in the record index, and the barcodes are
+		#rows of the barcodes column
+		records = np.searchsorted(
+			IO_utils.load_record_index(args['barcodes_index']),
+			np.array(reads_in_subgraph, dtype = np.uint64))
+		barcodes = Column_utils.load_column(
+			args['columns'], 'barcodes')[np.sort(records)]
+	else:
+		bc_file = open_barcodes(barcodes_unzipped)
+		barcodes_iter = IO_utils.read_fastq_random(
+			bc_file,
+			offsets = sorted(reads_in_subgraph, reverse = True),
+			decode = not args['bytes_mode'])
+		barcodes_data = [barcode_data for (barcode_data, _) in barcodes_iter]
+		bc_file.close()
+		
+		barcodes = Kmer_utils.get_barcode_array(
+			barcodes_data,
+			int(args['barcode_start']),
+			int(args['barcode_end']))
+	read_kmers, _ = Kmer_utils.get_cyclic_kmer_codes_batch(
+		barcodes, int(args['kmer_size']))
+	if(args.get('graph_backend') == 'arrays' or 
+		args.get('cycle_search') == 'dp'):
+		(codes, counts) = np.unique(read_kmers, return_counts = True)
+		return ArrayGraph(codes, counts, int(args['kmer_size']))
+	subgraph_kmer_counts = zip(*np.unique(read_kmers, return_counts = True))
 	
 	edges = []
-	for(kmer, count) in subgraph_kmer_counts.items():
-		edge = Edge(kmer[0:-1], kmer[1:], count)
+	for(kmer, count) in subgraph_kmer_counts:
+		kmer = Kmer_utils.decode_kmer(kmer, args['kmer_size'])
+		edge = Edge(kmer[0:-1], kmer[1:], int(count))
 		edges.append(edge)
 	subgraph = Graph(edges)
 	return subgraph
@@ -405,6 +655,32 @@ def threshold_paths(output_dir, paths, num_cells):
 	
 	return top_paths, threshold_out
 
+def get_knee_weight(weights, window_len):
+	"""
+	Online estimate of the inflection point of the path weight curve, for
+	adaptive breadth
+	Args
+		weights (list): weights of the unique paths found so far
+		window_len (int): as LOCAL_WINDOW_LEN in threshold_paths
+	Returns
+		weight at the steepest drop of log10(weight) by rank: the value at
+		the middle of the window_len wide least squares fit (as
+		local_lin_fit, in closed form) with the most negative slope. None
+		until there are at least window_len paths past that window
+	"""
+	MIN_WEIGHT = 10
+	weights = np.sort(
+		np.array([w for w in weights if w >= MIN_WEIGHT], dtype = float))[::-1]
+	if len(weights) < 2 * window_len:
+		return None
+	x = np.arange(window_len) - (window_len - 1) / 2.0
+	log_weights = np.log10(weights)
+	slopes = np.correlate(log_weights, x, mode = 'valid') / np.sum(x**2)
+	steepest = int(np.argmin(slopes))
+	if steepest + 2 * window_len > len(weights):
+		return None
+	return int(10**np.mean(log_weights[steepest:steepest + window_len]))
+
 def get_lmax(second_grad, LOCAL_WINDOW_LEN):
 	#finds zeros in
 	lmax = []
@@ -487,14 +763,18 @@ def assign_all_reads(params):
 		reads_unzipped, 
 		barcodes_unzipped) = params
 	
-	BUFFER_SIZE = 100000
 	MAX_KMER_SIZE = args['barcode_end'] - args['barcode_start']
 	MIN_KMER_SIZE = 6
 	
-	reads_assigned_db, reads_assigned_pipe = IO_utils.initialize_redis_pipeline()
+	reads_assigned = AssignmentStore(
+		consensus_bcs,
+		IO_utils.load_record_index(args['reads_index']),
+		IO_utils.load_record_index(args['barcodes_index']),
+		tmp_dir = output_dir)
 	pool = Pool(processes = args['threads'])
 	
 	#print('\tMapping kmers to consensus barcodes')
+	kmer_map = None
 	if args['split_levenshtein']:
 		print('\tAssigning reads to consensus barcodes using Levenshtein distance')
 	else:
@@ -502,23 +782,65 @@ def assign_all_reads(params):
 		kmer_map = map_kmers_to_bcs(consensus_bcs, MIN_KMER_SIZE, MAX_KMER_SIZE)
 	
 	read_count = 0
-	num_unassigned = 0
-	reads_f = open(reads_unzipped, 'rb')
-	barcodes_f = open(barcodes_unzipped, 'rb')
+	if args.get('columns') is not None and not args['split_levenshtein']:
+		cell_ids_iter = assign_columns(
+			pool, reads_assigned, kmer_map, MIN_KMER_SIZE, MAX_KMER_SIZE)
+	elif args['sharded']:
+		cell_ids_iter = assign_shards(
+			pool, reads_assigned, kmer_map, MIN_KMER_SIZE, MAX_KMER_SIZE)
+	else:
+		cell_ids_iter = assign_chunks(
+			pool, 
+			reads_assigned, 
+			kmer_map, 
+			MIN_KMER_SIZE, 
+			MAX_KMER_SIZE, 
+			reads_unzipped, 
+			barcodes_unzipped)
 	
-	encode = lambda i: str(i).encode('utf-8') 
-	encode_tup = lambda i, j: encode(i) + b',' + encode(j)
+	for (first_record, cell_ids) in cell_ids_iter:
+		reads_assigned.set_cell_ids(first_record, cell_ids)
+		read_count += len(cell_ids)
+		print('\tProcessed %i reads' % read_count)
+	pool.close()
 	
+	reads_assigned.group_by_cell()
+	print('\t%i reads could not be assigned' % \
+		reads_assigned.get_num_unassigned())
+	return reads_assigned
+
+def assign_chunks(
+	pool, 
+	reads_assigned, 
+	kmer_map, 
+	MIN_KMER_SIZE, 
+	MAX_KMER_SIZE, 
+	reads_unzipped, 
+	barcodes_unzipped):
+	"""
+	Parses reads in this process and assigns them in the pool, a chunk at
+	a time
+	Yields
+		(first_record, cell_ids) for each chunk (see AssignmentStore)
+	"""
+	BUFFER_SIZE = 100000
+	
+	first_record = 0
+	consensus_bcs = reads_assigned.cells
+	
+	reads_f = IO_utils.open_fastq(reads_unzipped, args['threads'])
+	barcodes_f = open_barcodes(barcodes_unzipped, args['threads'])
 	for reads_chunk, barcodes_chunk in zip(
 		IO_utils.get_read_chunks(
 			reads_f,
 			random = False,
-			BUFFER_SIZE = BUFFER_SIZE),
+			BUFFER_SIZE = BUFFER_SIZE,
+			decode = not args['bytes_mode']),
 		IO_utils.get_read_chunks(
 			barcodes_f,
 			random = False,
-			BUFFER_SIZE = BUFFER_SIZE)):
-		read_count += len(reads_chunk)
+			BUFFER_SIZE = BUFFER_SIZE,
+			decode = not args['bytes_mode'])):
 		
 		if args['split_levenshtein']:
 			assignments = pool.map(assign_read_levenshtein,
@@ -528,33 +850,141 @@ def assign_all_reads(params):
 					barcodes_chunk))
 		
 		else:
-			assignments = pool.map(assign_read_kmers, 
+			assignments = pool.map(assign_reads_kmers, 
 				zip(
 				repeat(kmer_map),
 				repeat(MIN_KMER_SIZE),
 				repeat(MAX_KMER_SIZE),
+				IO_utils.split_list(reads_chunk, args['threads']),
+				IO_utils.split_list(barcodes_chunk, args['threads'])))
+			assignments = [tup for sublist in assignments for tup in sublist]
+		yield (first_record, 
+			reads_assigned.get_cell_ids([tup[0] for tup in assignments]))
+		first_record += len(assignments)
+	
+	reads_f.close()
+	barcodes_f.close()
+
+def assign_shards(pool, reads_assigned, kmer_map, MIN_KMER_SIZE, MAX_KMER_SIZE):
+	"""
+	Sharded mode. Every worker reads, parses and assigns a range of 
+	records (see IO_utils.get_shards) and returns only the cell id of each
+	read
+	Yields
+		(first_record, cell_ids) for each shard (see AssignmentStore)
+	"""
+	SHARDS_PER_THREAD = 4
+	
+	shards = IO_utils.get_shards(
+		reads_assigned.barcodes_index, SHARDS_PER_THREAD * args['threads'])
+	cell_ids_iter = pool.imap(assign_shard, 
+		zip(
+		shards,
+		repeat(reads_assigned.cells),
+		repeat(kmer_map),
+		repeat(MIN_KMER_SIZE),
+		repeat(MAX_KMER_SIZE)))
+	for ((first, last), cell_ids) in zip(shards, cell_ids_iter):
+		yield (first, cell_ids)
+
+def assign_shard(params):
+	"""
+	Args (tuple)
+		shard: (first_record, last_record)
+		cell_barcodes: sorted list of consensus barcodes (cell ids)
+		kmer_map, min_kmer_size, max_kmer_size: as for assign_reads_kmers
+	Returns np.array (int32)
+		index into cell_barcodes of the assignment of each read in the 
+		shard, or -1 if the read is unassigned
+	"""
+	BUFFER_SIZE = 10000
+	(	shard,
+		cell_barcodes,
+		kmer_map,
+		min_kmer_size,
+		max_kmer_size) = params
+	
+	cell_ids = {bc : i for (i, bc) in enumerate(cell_barcodes)}
+	cell_ids['unassigned'] = -1
+	reads_f = IO_utils.open_fastq(args['reads'])
+	barcodes_f = open_barcodes(args['barcodes'])
+	assignments = []
+	for reads_chunk, barcodes_chunk in zip(
+		IO_utils.get_read_chunks(
+			reads_f,
+			BUFFER_SIZE = BUFFER_SIZE,
+			record_index = IO_utils.load_record_index(args['reads_index']),
+			decode = not args['bytes_mode'],
+			shard = shard),
+		IO_utils.get_read_chunks(
+			barcodes_f,
+			BUFFER_SIZE = BUFFER_SIZE,
+			record_index = IO_utils.load_record_index(args['barcodes_index']),
+			decode = not args['bytes_mode'],
+			shard = shard)):
+		
+		if args['split_levenshtein']:
+			assignments += [assign_read_levenshtein((cell_barcodes, r, b)) \
+				for (r, b) in zip(reads_chunk, barcodes_chunk)]
+		else:
+			assignments += assign_reads_kmers((
+				kmer_map,
+				min_kmer_size,
+				max_kmer_size,
 				reads_chunk,
 				barcodes_chunk))
-		
-			
-		for (assignment, offset1, offset2) in assignments:
-			if(assignment == 'unassigned'):
-				num_unassigned += 1
-			#reads_assigned[assignment].append((offset1, offset2))
-			reads_assigned_pipe.rpush(
-			 	assignment.encode('utf-8'), 
-			 	encode_tup(offset1, offset2))
-				
-		reads_assigned_pipe.execute()
-		print('\tProcessed %i reads' % read_count)
-	
 	reads_f.close()
 	barcodes_f.close()
-	pool.close()
+	return np.array(
+		[cell_ids[tup[0]] for tup in assignments], dtype = np.int32)
+
+def assign_columns(pool, reads_assigned, kmer_map, MIN_KMER_SIZE, MAX_KMER_SIZE):
+	"""
+	Barcode columns mode. As assign_shards, but every worker slices its 
+	range of records from the barcodes column instead of parsing fastq
+	Yields
+		(first_record, cell_ids) for each range (see AssignmentStore)
+	"""
+	SHARDS_PER_THREAD = 4
+	
+	shards = IO_utils.get_shards(
+		reads_assigned.barcodes_index, SHARDS_PER_THREAD * args['threads'])
+	cell_ids_iter = pool.imap(assign_column_range, 
+		zip(
+		shards,
+		repeat(reads_assigned.cells),
+		repeat(kmer_map),
+		repeat(MIN_KMER_SIZE),
+		repeat(MAX_KMER_SIZE)))
+	for ((first, last), cell_ids) in zip(shards, cell_ids_iter):
+		yield (first, cell_ids)
+
+def assign_column_range(params):
+	"""
+	Args (tuple)
+		as for assign_shard
+	Returns np.array (int32)
+		as for assign_shard
+	"""
+	BUFFER_SIZE = 10000
+	(	(first_record, last_record),
+		cell_barcodes,
+		kmer_map,
+		min_kmer_size,
+		max_kmer_size) = params
 	
-	print('\t%i reads could not be assigned' % num_unassigned)
-	#return pickle_files
-	return reads_assigned_db, reads_assigned_pipe
+	cell_ids = {bc : i for (i, bc) in enumerate(cell_barcodes)}
+	cell_ids['unassigned'] = -1
+	column = Column_utils.load_column(args['columns'], 'barcodes')
+	assignments = []
+	for start in range(first_record, last_record, BUFFER_SIZE):
+		assignments += assign_barcodes_kmers(
+			kmer_map,
+			min_kmer_size,
+			max_kmer_size,
+			column[start:min(start + BUFFER_SIZE, last_record)])
+	return np.array(
+		[cell_ids[assignment] for assignment in assignments], dtype = np.int32)
 
 def initialize_reads_assigned(consensus_bcs):
 	reads_assigned = {}
@@ -565,61 +995,110 @@ def initialize_reads_assigned(consensus_bcs):
 	return reads_assigned
 
 def map_kmers_to_bcs(consensus_bcs, MIN_KMER_SIZE, MAX_KMER_SIZE):
+	"""
+	Returns dict
+		kmer_map[tagged kmer code] -> list of consensus barcodes, for kmer
+			sizes MAX_KMER_SIZE down to MIN_KMER_SIZE + 1. Codes are tagged
+			with their size (Kmer_utils.get_tagged_codes), so all sizes 
+			share one map
 	
+	The cyclic kmers of all barcodes are computed once, at the largest 
+	size. Each smaller size is a shift of the codes of the size above
+	"""
 	kmer_map = {}
+	consensus_bcs = list(consensus_bcs)
+	if len(consensus_bcs) == 0:
+		return kmer_map
+	barcodes = Kmer_utils.get_barcode_array(
+		[[None, cell_barcode] for cell_barcode in consensus_bcs],
+		0,
+		MAX_KMER_SIZE)
+	codes, _ = Kmer_utils.get_cyclic_kmer_codes_batch(barcodes, MAX_KMER_SIZE)
+	codes = codes.reshape(len(consensus_bcs), -1)
 	for kmer_size in range(MAX_KMER_SIZE, MIN_KMER_SIZE, -1):
-		kmer_map_ = \
-			map_kmers_to_bcs_fixed_k(consensus_bcs, kmer_size)
-		kmer_map = dict(list(kmer_map_.items()) + list(kmer_map.items()))		
+		tagged_codes = Kmer_utils.get_tagged_codes(
+			Kmer_utils.get_shorter_kmer_codes(codes, MAX_KMER_SIZE, kmer_size),
+			kmer_size)
+		for (cell_barcode, kmers) in zip(consensus_bcs, tagged_codes.tolist()):
+			for kmer in kmers:
+				if(kmer not in kmer_map):
+					kmer_map[kmer] = []
+				kmer_map[kmer].append(cell_barcode)
 	return kmer_map
-
-def map_kmers_to_bcs_fixed_k(consensus_bcs, kmer_size):
-	kmers_to_paths = {}
-	for cell_barcode in consensus_bcs:
-		kmers = IO_utils.get_cyclic_kmers(
-			['na', cell_barcode, 'na', cell_barcode],
-			kmer_size,
-			0,
-			len(cell_barcode),
-			indel=True)
-		for (kmer, _) in kmers:
-			if(kmer not in kmers_to_paths.keys()):
-				kmers_to_paths[kmer] = []
-			kmers_to_paths[kmer].append(cell_barcode)
-	return kmers_to_paths
-	
-def assign_read_kmers(params):
-	"""
-	Assigns a single read to a cell barcode by kmer compatibility
+	
+def assign_reads_kmers(params):
+	"""
+	Assigns a chunk of reads to cell barcodes by kmer compatibility
 	args (tuple)
-		kmers_to_paths: dict of kmer -> list of paths that contain it
+		kmer_map: tagged kmer code -> list of paths that contain it (see
+			map_kmers_to_bcs)
 		min_kmer_size
 		max_kmer_size
-		read: list of fastq entry lines
+		reads_chunk: list of (fastq entry lines, offset) for reads
+		barcodes_chunk: list of (fastq entry lines, offset) for barcodes
+	Returns list
+		(assignment, reads_offset, barcodes_offset) for each read
+	
+	Kmers are computed for the whole chunk at once, at the largest kmer 
+	size. Reads that are not uniquely assigned are retried at the next 
+	smaller kmer size, whose codes are a shift of the current ones
 	"""
 	(kmer_map,
 		min_kmer_size,
 		max_kmer_size,
-		(reads_data, reads_offset),
-		(barcodes_data, barcodes_offset)) = params
-		
+		reads_chunk,
+		barcodes_chunk) = params
+	
+	if len(barcodes_chunk) == 0:
+		return []
+	barcodes = Kmer_utils.get_barcode_array(
+		[barcodes_data for (barcodes_data, _) in barcodes_chunk],
+		args['barcode_start'],
+		args['barcode_end'])
+	assignments = assign_barcodes_kmers(
+		kmer_map, min_kmer_size, max_kmer_size, barcodes)
+	return [(assignment, reads_offset, barcodes_offset) for 
+		(assignment, (_, reads_offset), (_, barcodes_offset)) in 
+		zip(assignments, reads_chunk, barcodes_chunk)]
+
+def assign_barcodes_kmers(kmer_map, min_kmer_size, max_kmer_size, barcodes):
+	"""
+	Args
+		kmer_map, min_kmer_size, max_kmer_size: as for assign_reads_kmers
+		barcodes (np.array): barcode symbol codes, one row per read (see
+			Kmer_utils.get_barcode_array)
+	Returns list
+		consensus barcode, or 'unassigned', for each read
+	"""
+	assignments = ['unassigned'] * len(barcodes)
+	if len(barcodes) == 0:
+		return assignments
+	codes, _ = Kmer_utils.get_cyclic_kmer_codes_batch(barcodes, max_kmer_size)
+	codes = codes.reshape(len(barcodes), -1)
+	unassigned = np.arange(len(barcodes))
 	for kmer_size in range(max_kmer_size, min_kmer_size, -1):
-		read_kmers = IO_utils.get_cyclic_kmers(
-			barcodes_data, 
-			kmer_size,
-			args['barcode_start'], 
-			args['barcode_end'],
-			indel = True)
-		bcs, is_assigned, is_unique = get_most_common_bc(
-			kmer_map, read_kmers)
-		if is_assigned and is_unique:
-			return (bcs[0], reads_offset, barcodes_offset)
-		#outherwise decrement kmer size and try again
-	return ('unassigned', reads_offset, barcodes_offset)
+		if len(unassigned) == 0:
+			break
+		tagged_codes = Kmer_utils.get_tagged_codes(
+			Kmer_utils.get_shorter_kmer_codes(codes, max_kmer_size, kmer_size),
+			kmer_size)
+		is_unassigned = np.zeros(len(unassigned), dtype = bool)
+		for (j, (i, read_kmers)) in enumerate(
+			zip(unassigned, tagged_codes.tolist())):
+			bcs, is_assigned, is_unique = get_most_common_bc(
+				kmer_map, read_kmers)
+			if is_assigned and is_unique:
+				assignments[i] = bcs[0]
+			else:
+				#outherwise decrement kmer size and try again
+				is_unassigned[j] = True
+		unassigned = unassigned[is_unassigned]
+		codes = codes[is_unassigned]
+	return assignments
 
 def get_most_common_bc(kmer_map, read_kmers):
 	compatable_bcs = {}
-	for (kmer, _) in read_kmers:
+	for kmer in read_kmers:
 		bcs = kmer_map.get(kmer, None)
 		if bcs != None:
 			increment = 1.0 / len(bcs)
@@ -650,6 +1129,8 @@ def assign_read_levenshtein(params):
 	
 	obs_bc = barcodes_data[1].strip()[ \
 		args['barcode_start']: args['barcode_end']]
+	if isinstance(obs_bc, bytes):
+		obs_bc = obs_bc.decode('utf-8')
 	
 	min_lev_dist = len(obs_bc)
 	assignment = []
@@ -679,8 +1160,7 @@ def update_paths_list(top_paths, reads_per_cell):
 def write_split_fastqs(params):
 	import gzip
 	(	consensus_bcs,
-		reads_assigned_db,
-		reads_assigned_pipe,
+		reads_assigned,
 		output_dir,
 		reads_unzipped,
 		barcodes_unzipped) = params
@@ -694,14 +1174,22 @@ def write_split_fastqs(params):
 	reads_per_cell = {}
 	consensus_bcs.add('unassigned')
 	
+	#bytes mode writes the lines as read, without encoding
+	if args['bytes_mode']:
+		encode = lambda s: s.encode('utf-8')
+		write = lambda lines: b'\n'.join(lines) + b'\n'
+	else:
+		encode = lambda s: s
+		write = lambda lines: ('\n'.join(lines) + '\n').encode('utf-8')
+	
 	for cell in consensus_bcs:
 		
-		try:
-			cell_offsets = IO_utils.get_from_db(reads_assigned_pipe, [cell])
-		except IndexError:
-			pass
-		
-		#cell_offsets = IO_utils.read_from_pickle(reads_assigned_pickled, cell)
+		reads_offsets, barcodes_offsets = reads_assigned.get_offsets(cell)
+		umis_iter = None
+		if args.get('columns') is not None:
+			#offsets are consumed from the end, so UMIs are in reverse order
+			umis_iter = iter(Column_utils.load_column(args['columns'], 'umis')[
+				reads_assigned.get_records(cell)[::-1]])
 		cell_name = 'cell_%s' % cell
 		
 		#initialie all readers and writers
@@ -716,17 +1204,19 @@ def write_split_fastqs(params):
 		reads_writer = gzip.open(output_files[cell_name]['reads'], 'wb')
 		barcodes_writer = gzip.open(output_files[cell_name]['barcodes'], 'wb')
 		umi_writer = open(output_files[cell_name]['umi'], 'wb')
-		reads_f = open(reads_unzipped, 'rb')
-		barcodes_f = open(barcodes_unzipped, 'rb')
+		reads_f = IO_utils.open_fastq(reads_unzipped)
+		barcodes_f = open_barcodes(barcodes_unzipped)
 		
 		reads_iter = IO_utils.read_fastq_random(
 			reads_f, 
-			offsets = 
-				[cell_offsets[i] for i in range(len(cell_offsets)) if i % 2 == 0])
+			offsets = reads_offsets,
+			decode = not args['bytes_mode'])
 		barcodes_iter = IO_utils.read_fastq_random(
 			barcodes_f,
-			offsets = 
-				[cell_offsets[i] for i in range(len(cell_offsets)) if i % 2 == 1])
+			offsets = barcodes_offsets,
+			decode = not args['bytes_mode'])
+		cell_tag = encode(' %s' % cell_name.replace('_', ':'))
+		(space, underscore) = (encode(' '), encode('_'))
 		reads_in_cell = 0
 		while(True):
 			try:
@@ -736,18 +1226,21 @@ def write_split_fastqs(params):
 			except StopIteration:
 				break
 			
-			reads_data[0] += ' %s' % cell_name.replace('_', ':')
-			reads_data[0] = reads_data[0].replace(' ', '_')
-			barcodes_data[0] += ' %s' % cell_name.replace('_', ':')	
-			barcodes_data[0] = barcodes_data[0].replace(' ', '_')
+			reads_data[0] += cell_tag
+			reads_data[0] = reads_data[0].replace(space, underscore)
+			barcodes_data[0] += cell_tag
+			barcodes_data[0] = barcodes_data[0].replace(space, underscore)
 					
-			umi = barcodes_data[1][
-				int(args['umi_start']): int(args['umi_end'])]
-			reads_writer.write(
-				('\n'.join(reads_data) + '\n').encode('utf-8'))
-			barcodes_writer.write(
-				('\n'.join(barcodes_data) + '\n').encode('utf-8'))
-			umi_writer.write((umi + '\n').encode('utf-8'))
+			if umis_iter is not None:
+				umi = Column_utils.get_umi(next(umis_iter))
+				if not args['bytes_mode']:
+					umi = umi.decode('utf-8')
+			else:
+				umi = barcodes_data[1][
+					int(args['umi_start']): int(args['umi_end'])]
+			reads_writer.write(write(reads_data))
+			barcodes_writer.write(write(barcodes_data))
+			umi_writer.write(write([umi]))
 		
 		reads_writer.close()
 		umi_writer.close()
@@ -774,6 +1267,10 @@ def get_args():
 		type=list,
 		help='Fq entry line offsets for barcoddes file',
 		required=True)
+	parser.add_argument('--umis',
+		type=str,
+		help='UMIs file name, merged with the barcodes file (10x genomics)',
+		default=None)
 	parser.add_argument('--reads', 
 		type=str, 
 		help='RNAseq reads file name (unzipped)', 
@@ -782,6 +1279,14 @@ def get_args():
 		type=list,
 		help='Fq entry line offsets for reads file',
 		required=True)
+	parser.add_argument('--barcodes_index',
+		type=str,
+		help='Record offset index (.npy) for barcodes file',
+		required=True)
+	parser.add_argument('--reads_index',
+		type=str,
+		help='Record offset index (.npy) for reads file',
+		required=True)
 		
 	parser.add_argument('--output_dir', 
 		type=str, 
@@ -824,6 +1329,48 @@ def get_args():
 		help='Estimated number of cells.',
 		default=None)
 	
+	parser.add_argument('--bytes_mode',
+		help='Keep sequences as bytes instead of decoding them to str.',
+		action='store_true')
+	parser.add_argument('--sharded',
+		help='Workers read and parse their own ranges of records.',
+		action='store_true')
+	parser.add_argument('--kmer_index_cache',
+		type=str,
+		help='Directory for cached kmer indices (default: output_dir).',
+		default=None)
+	parser.add_argument('--kmer_sketch_mb',
+		type=int,
+		help='Count kmers approximately in this many MB (count-min sketch).',
+		default=None)
+	parser.add_argument('--graph_backend',
+		type=str,
+		choices=['objects', 'arrays'],
+		help='Barcode subgraphs as Edge objects or as arrays (ArrayGraph).',
+		default='objects')
+	parser.add_argument('--cycle_search',
+		type=str,
+		choices=['dfs', 'dp'],
+		help='Depth first search, or exact max bottleneck cycles (dynamic programming).',
+		default='dfs')
+	parser.add_argument('--columns',
+		type=str,
+		help='Prefix of barcode and UMI columns (see Column_utils.build_columns).',
+		default=None)
+	parser.add_argument('--skip_explained_seeds',
+		help='Search seeds that are sequencing errors of cycles found from earlier seeds last.',
+		action='store_true')
+	parser.add_argument('--adaptive_breadth',
+		help='Search seeds until their paths fall well below the knee (ignores --breadth).',
+		action='store_true')
+	parser.add_argument('--global_graph',
+		help='Search views of one graph of all sampled kmers, not per seed subgraphs.',
+		action='store_true')
+	parser.add_argument('--kmer_bloom_mb',
+		type=int,
+		help='Index kmers from their second sighting (bloom filter of this many MB).',
+		default=None)
+	
 	#only for reviewer expts. never actually use this!
 	parser.add_argument('--split_levenshtein',
 		type = bool,
@@ -0,0 +1,118 @@
+"""
+Akshay Tambe
+Pachter and Doudna groups
+
+Assignment_utils.py
+In-process store for the assignment of reads to cells
+	Each read (fastq record) gets an int32 cell id, -1 if unassigned
+	Once all reads are assigned, reads are grouped by cell (CSR layout):
+		records sorted by cell id with a stable argsort, and a pointer to
+		the first record of every cell. The reads of a cell are then a
+		contiguous slice, in file order
+	Read offsets come from the record indices (see IO_utils.index_fastq)
+"""
+import os
+import tempfile
+import numpy as np
+
+UNASSIGNED = -1
+MEMMAP_MIN_READS = 2**26
+	#larger cell id arrays (256 MB) are memory mapped to disk
+
+class AssignmentStore:
+	"""
+	Attributes
+		cells (list): sorted cell barcodes. cell id i is cells[i]
+		cell_ids (np.array): int32 cell id of every read
+		reads_index, barcodes_index (np.array): record start offsets
+		order, indptr (np.array): CSR grouping of reads by cell, built by
+			group_by_cell. Cell id i (and UNASSIGNED as -1) owns
+			order[indptr[i + 1]:indptr[i + 2]]
+	"""
+	def __init__(self, _cells, _reads_index, _barcodes_index, tmp_dir = None):
+		"""
+		Args
+			_cells (iterable): consensus cell barcodes
+			_reads_index, _barcodes_index (np.array): record offset indices
+				of the paired reads and barcodes files
+			tmp_dir (str): directory for a temporary .npy file to memory map
+				the cell id array to, if there are at least MEMMAP_MIN_READS
+				reads. The file is deleted by close
+		"""
+		assert len(_reads_index) == len(_barcodes_index), \
+			'Reads and barcodes files have different numbers of records'
+		self.cells = sorted(_cells)
+		self.cell_nums = {cell : i for (i, cell) in enumerate(self.cells)}
+		self.cell_nums['unassigned'] = UNASSIGNED
+		self.reads_index = _reads_index
+		self.barcodes_index = _barcodes_index
+
+		num_reads = len(_reads_index)
+		self.fname = None
+		if tmp_dir is not None and num_reads >= MEMMAP_MIN_READS:
+			(fd, self.fname) = tempfile.mkstemp(
+				prefix = 'cell_ids_', suffix = '.npy', dir = tmp_dir)
+			os.close(fd)
+			self.cell_ids = np.lib.format.open_memmap(
+				self.fname, mode = 'w+', dtype = np.int32, shape = (num_reads,))
+			self.cell_ids[:] = UNASSIGNED
+		else:
+			self.cell_ids = np.full(num_reads, UNASSIGNED, dtype = np.int32)
+		self.order = None
+		self.indptr = None
+
+	def get_cell_ids(self, assignments):
+		"""
+		Args
+			assignments (list): cell barcodes, or 'unassigned'
+		Returns np.array (int32)
+		"""
+		return np.array(
+			[self.cell_nums[cell] for cell in assignments], dtype = np.int32)
+
+	def set_cell_ids(self, first_record, cell_ids):
+		"""
+		Stores the cell ids of records first_record ...
+		"""
+		self.cell_ids[first_record:first_record + len(cell_ids)] = cell_ids
+
+	def group_by_cell(self):
+		self.order = np.argsort(self.cell_ids, kind = 'stable')
+		counts = np.bincount(
+			self.cell_ids.astype(np.int64) - UNASSIGNED,
+			minlength = len(self.cells) - UNASSIGNED)
+		self.indptr = np.zeros(len(counts) + 1, dtype = np.int64)
+		np.cumsum(counts, out = self.indptr[1:])
+
+	def get_records(self, cell):
+		"""
+		Returns np.array
+			record numbers of the reads assigned to cell, in file order
+		"""
+		if self.order is None:
+			self.group_by_cell()
+		i = self.cell_nums[cell] - UNASSIGNED
+		return self.order[self.indptr[i]:self.indptr[i + 1]]
+
+	def get_offsets(self, cell):
+		"""
+		Returns
+			(reads_offsets, barcodes_offsets) lists for the reads of cell
+		"""
+		records = self.get_records(cell)
+		return (self.reads_index[records].tolist(),
+			self.barcodes_index[records].tolist())
+
+	def get_num_unassigned(self):
+		return int(np.count_nonzero(self.cell_ids == UNASSIGNED))
+	
+	def close(self):
+		"""
+		Frees the arrays, and deletes the memory mapped cell id file
+		"""
+		self.cell_ids = None
+		self.order = None
+		self.indptr = None
+		if self.fname is not None:
+			os.remove(self.fname)
+			self.fname = None
@@ -0,0 +1,519 @@
+"""
+Akshay Tambe
+Pachter and Doudna groups
+
+Benchmark_utils.py
+Timing comparisons between alternative implementations
+	Usage:
+		python -m sircel.utils.Benchmark_utils [benchmark] [input files]
+	Benchmarks:
+		parsers		fastq parsers for get_read_chunks
+		kmers		cyclic kmer codes: read by read vs batch, and checks that
+				they agree (also for kmers longer than Kmer_utils.MAX_K, as
+				in read assignment for 10x genomics, kmer size 26)
+				(arguments: fastq, kmer size, barcode start, barcode end)
+		postings	kmer index postings: memory and decode throughput
+				(arguments: fastq, kmer size, barcode start, barcode end)
+		sketch		approximate (count-min sketch) vs exact kmer counting
+				(arguments: fastq, sketch MB, kmer size, barcode start, barcode end)
+		bloom		bloom filter gated vs exact kmer indexing
+				(arguments: fastq, bloom MB, kmer size, barcode start, barcode end)
+		graph		barcode subgraphs: Edge objects (Graph) vs arrays (ArrayGraph)
+				(arguments: fastq, kmer size, barcode start, barcode end)
+		cycles		regression check of successive cycles from one seed, for
+				both graph backends (no arguments)
+"""
+import sys
+import time
+import numpy as np
+
+from sircel.utils import IO_utils, Kmer_utils
+from sircel.utils.Graph_utils import Edge, Graph, ArrayGraph
+
+def benchmark_fastq_parsers(fq_fnames, BUFFER_SIZE = 100000):
+	"""
+	Args
+		fq_fnames (str): fastq file name(s), as for IO_utils.open_fastq
+	Returns
+		dict of parser name -> (seconds, reads per second)
+
+	Reads the whole file through get_read_chunks with every parser, and
+	checks that all parsers return the same reads
+	"""
+	timings = {}
+	reference = None
+	for parser in ['lines', 'mmap']:
+		fq = IO_utils.open_fastq(fq_fnames)
+		start_time = time.time()
+		num_reads = 0
+		checksum = 0
+		for chunk in IO_utils.get_read_chunks(
+			fq, BUFFER_SIZE = BUFFER_SIZE, parser = parser):
+			num_reads += len(chunk)
+			checksum += sum([offset for (_, offset) in chunk])
+		elapsed_time = time.time() - start_time
+		fq.close()
+
+		if reference == None:
+			reference = (num_reads, checksum)
+		assert (num_reads, checksum) == reference, \
+			'Parser %s disagrees with %s' % (parser, 'lines')
+		timings[parser] = (elapsed_time, num_reads / elapsed_time)
+		print('%s\t%i reads\t%0.2f seconds\t%0.0f reads / second' % \
+			(parser, num_reads, elapsed_time, num_reads / elapsed_time))
+	return timings
+
+def benchmark_kmer_codes(
+	fq_fnames, 
+	kmer_size = 8, 
+	barcode_start = 0, 
+	barcode_end = 12, 
+	NUM_READS = 100000):
+	"""
+	Args
+		fq_fnames (str): barcodes fastq file name(s)
+		kmer_size, barcode_start, barcode_end (int): as for Split_reads
+	Returns
+		dict of 'reads', 'batch' -> (seconds, reads per second)
+	
+	Computes the cyclic kmer codes of the first NUM_READS reads one read 
+	at a time (get_cyclic_kmer_codes) and for all reads at once 
+	(get_cyclic_kmer_codes_batch), and checks that they are the same.
+	Also checks, for the first NUM_CHECK_READS reads, that the codes of
+	every smaller kmer size (down to MIN_KMER_SIZE + 1, as read 
+	assignment) are shifts of the batch codes, and that the size tags
+	keep them apart
+	"""
+	NUM_CHECK_READS = 1000
+	MIN_KMER_SIZE = 6
+	(kmer_size, barcode_start, barcode_end) = \
+		(int(kmer_size), int(barcode_start), int(barcode_end))
+	fq = IO_utils.open_fastq(fq_fnames)
+	reads = [read for (read, _) in 
+		next(IO_utils.get_read_chunks(fq, BUFFER_SIZE = NUM_READS))]
+	fq.close()
+	
+	start_time = time.time()
+	reference = []
+	for read in reads:
+		reference += Kmer_utils.get_cyclic_kmer_codes(
+			read, kmer_size, barcode_start, barcode_end)
+	reads_time = time.time() - start_time
+	
+	start_time = time.time()
+	codes, _ = Kmer_utils.get_cyclic_kmer_codes_batch(
+		Kmer_utils.get_barcode_array(reads, barcode_start, barcode_end),
+		kmer_size)
+	batch_time = time.time() - start_time
+	assert codes.tolist() == reference, \
+		'Batch and read by read kmer codes differ (kmer size %i)' % kmer_size
+	
+	check_reads = reads[0:NUM_CHECK_READS]
+	check_codes, _ = Kmer_utils.get_cyclic_kmer_codes_batch(
+		Kmer_utils.get_barcode_array(check_reads, barcode_start, barcode_end),
+		kmer_size)
+	tagged = set()
+	for shorter_k in range(kmer_size, MIN_KMER_SIZE, -1):
+		reference = []
+		for read in check_reads:
+			reference += Kmer_utils.get_cyclic_kmer_codes(
+				read, shorter_k, barcode_start, barcode_end)
+		shorter_codes = Kmer_utils.get_shorter_kmer_codes(
+			check_codes, kmer_size, shorter_k)
+		assert shorter_codes.tolist() == reference, \
+			'Shifted kmer codes differ (kmer size %i)' % shorter_k
+		tagged_codes = set(
+			Kmer_utils.get_tagged_codes(shorter_codes, shorter_k).tolist())
+		assert len(tagged & tagged_codes) == 0, \
+			'Tagged kmer codes of different sizes collide'
+		tagged |= tagged_codes
+	
+	results = {
+		'reads' : (reads_time, len(reads) / reads_time),
+		'batch' : (batch_time, len(reads) / batch_time)}
+	print('%i reads\t%i kmers (identical)' % (len(reads), len(codes)))
+	for (name, timing) in results.items():
+		print('%s\t%0.2f seconds\t%0.0f reads / second' % ((name,) + timing))
+	return results
+
+def benchmark_postings(
+	fq_fnames, 
+	kmer_size = 8, 
+	barcode_start = 0, 
+	barcode_end = 12, 
+	NUM_READS = 100000,
+	NUM_SEEDS = 1000):
+	"""
+	Args
+		fq_fnames (str): barcodes fastq file name(s)
+		kmer_size, barcode_start, barcode_end (int): as for Split_reads
+	Returns
+		dict of postings layout -> bytes per posting, and 
+		'decode', 'decode_seeds' -> (seconds, postings per second)
+	
+	Indexes the first NUM_READS reads, and compares the memory of the 
+	compressed (varint delta) postings with uint64 arrays and with the 
+	python lists of ints used before. Then decodes every postings list,
+	and the NUM_SEEDS longest ones (as find_path_from_kmer does for seeds)
+	"""
+	(kmer_size, barcode_start, barcode_end) = \
+		(int(kmer_size), int(barcode_start), int(barcode_end))
+	fq = IO_utils.open_fastq(fq_fnames)
+	reads_chunk = next(IO_utils.get_read_chunks(fq, BUFFER_SIZE = NUM_READS))
+	fq.close()
+	
+	kmer_index = Kmer_utils.KmerIndex(kmer_size)
+	barcodes = Kmer_utils.get_barcode_array(
+		[read for (read, _) in reads_chunk], barcode_start, barcode_end)
+	codes, rows = Kmer_utils.get_cyclic_kmer_codes_batch(barcodes, kmer_size)
+	offsets = np.array([offset for (_, offset) in reads_chunk], dtype = np.int64)
+	kmer_index.add(codes, offsets[rows])
+	start_time = time.time()
+	kmer_index.group_postings()
+	encode_time = time.time() - start_time
+	num_postings = int(kmer_index.counts.sum())
+	
+	start_time = time.time()
+	postings_lists = [kmer_index.get_postings(code) for code in kmer_index.codes]
+	decode_time = time.time() - start_time
+	start_time = time.time()
+	seeds = kmer_index.get_most_common()[0:NUM_SEEDS]
+	num_seed_postings = sum(
+		[len(kmer_index.get_postings(code)) for code in seeds])
+	seeds_time = time.time() - start_time
+	
+	sizes = {
+		'varint' : kmer_index.postings.nbytes + kmer_index.indptr.nbytes,
+		'uint64' : 8 * num_postings + kmer_index.indptr.nbytes,
+		'lists' : sum([sys.getsizeof(lst) + \
+			sum([sys.getsizeof(i) for i in lst]) for lst in \
+			[postings.tolist() for postings in postings_lists]])}
+	results = {}
+	print('%i reads\t%i kmers\t%i postings' % \
+		(len(reads_chunk), kmer_index.get_num_kmers(), num_postings))
+	for (name, size) in sizes.items():
+		results[name] = size / num_postings
+		print('%s\t%0.2f bytes / posting\t%0.1f MB' % \
+			(name, size / num_postings, size / 2**20))
+	results['decode'] = (decode_time, num_postings / decode_time)
+	print('encode\t%0.2f seconds\t%0.0f postings / second' % \
+		(encode_time, num_postings / encode_time))
+	results['decode_seeds'] = (seeds_time, num_seed_postings / seeds_time)
+	print('decode\t%0.2f seconds\t%0.0f postings / second' % \
+		results['decode'])
+	print('decode (seeds)\t%0.2f seconds\t%0.0f postings / second' % \
+		results['decode_seeds'])
+	return results
+
+def benchmark_sketch(
+	fq_fnames,
+	sketch_mb = 1,
+	kmer_size = 8,
+	barcode_start = 0,
+	barcode_end = 12,
+	MIN_COUNT = 3,
+	NUM_SEEDS = 1000,
+	BUFFER_SIZE = 10000):
+	"""
+	Args
+		fq_fnames (str): barcodes fastq file name(s)
+		sketch_mb (int): memory of the count-min sketch
+		kmer_size, barcode_start, barcode_end (int): as for Split_reads
+	Returns dict
+		memory (bytes) of both indices, recall of kmers with an exact count
+		of at least MIN_COUNT, mean relative error of the estimated counts,
+		the overlap of the top NUM_SEEDS seed kmers ('$' kmers), and the 
+		convergence statistic (count_correlation) after every chunk
+	
+	Indexes every read of the file with exact counts and with a sketch
+	"""
+	(sketch_mb, kmer_size, barcode_start, barcode_end) = \
+		(int(sketch_mb), int(kmer_size), int(barcode_start), int(barcode_end))
+	exact = Kmer_utils.KmerIndex(kmer_size)
+	approximate = Kmer_utils.KmerIndex(
+		kmer_size, 
+		sketch = Kmer_utils.CountMinSketch(sketch_mb * 2**20),
+		min_count = MIN_COUNT)
+	times = {'exact' : 0, 'sketch' : 0}
+	correlations = {'exact' : [], 'sketch' : []}
+	fq = IO_utils.open_fastq(fq_fnames)
+	for reads_chunk in IO_utils.get_read_chunks(fq, BUFFER_SIZE = BUFFER_SIZE):
+		barcodes = Kmer_utils.get_barcode_array(
+			[read for (read, _) in reads_chunk], barcode_start, barcode_end)
+		codes, rows = Kmer_utils.get_cyclic_kmer_codes_batch(barcodes, kmer_size)
+		offsets = np.array(
+			[offset for (_, offset) in reads_chunk], dtype = np.int64)[rows]
+		for (name, kmer_index) in [('exact', exact), ('sketch', approximate)]:
+			start_time = time.time()
+			kmer_index.add(codes, offsets)
+			times[name] += time.time() - start_time
+			correlations[name].append(kmer_index.count_correlation)
+	fq.close()
+	for kmer_index in [exact, approximate]:
+		kmer_index.group_postings()
+	
+	get_memory = lambda kmer_index: sum([getattr(kmer_index, name).nbytes for \
+		name in Kmer_utils.KMER_INDEX_ARRAYS])
+	frequent = exact.codes[exact.counts >= MIN_COUNT]
+	estimates = approximate.sketch.query(exact.codes)
+	get_seeds = lambda kmer_index: [code for code in \
+		kmer_index.get_most_common().tolist() if \
+		Kmer_utils.is_sentinel_kmer(code, kmer_size)][0:NUM_SEEDS]
+	
+	results = {
+		'memory_exact' : get_memory(exact),
+		'memory_sketch' : get_memory(approximate) + \
+			approximate.sketch.table.nbytes,
+		'kmers_exact' : exact.get_num_kmers(),
+		'kmers_sketch' : approximate.get_num_kmers(),
+		'recall' : np.isin(frequent, approximate.codes).mean(),
+		'relative_error' : np.mean((estimates - exact.counts) / exact.counts),
+		'seed_overlap' : len(set(get_seeds(exact)) & set(get_seeds(approximate))) / \
+			max(1, len(get_seeds(exact))),
+		'correlations_exact' : correlations['exact'],
+		'correlations_sketch' : correlations['sketch']}
+	for name in ['exact', 'sketch']:
+		print('%s\t%i kmers indexed\t%0.1f MB\t%0.2f seconds' % (name, 
+			results['kmers_%s' % name], 
+			results['memory_%s' % name] / 2**20, 
+			times[name]))
+	print('recall of kmers seen >= %i times\t%0.4f' % \
+		(MIN_COUNT, results['recall']))
+	print('mean relative error of estimated counts\t%0.4f' % \
+		results['relative_error'])
+	print('overlap of top %i seeds\t%0.4f' % (NUM_SEEDS, results['seed_overlap']))
+	for name in ['exact', 'sketch']:
+		print('%s\tconvergence statistic by chunk\t%s' % (name, 
+			' '.join(['%0.4f' % r for r in correlations[name]])))
+	return results
+
+def benchmark_bloom(
+	fq_fnames,
+	bloom_mb = 1,
+	kmer_size = 8,
+	barcode_start = 0,
+	barcode_end = 12,
+	NUM_SEEDS = 1000,
+	BUFFER_SIZE = 10000):
+	"""
+	Args
+		fq_fnames (str): barcodes fastq file name(s)
+		bloom_mb (int): memory of the bloom filter
+		kmer_size, barcode_start, barcode_end (int): as for Split_reads
+	Returns dict
+		memory (bytes) and insertion time of both indices, the number of
+		kmers indexed, the largest error of the corrected counts, and the
+		overlap of the top NUM_SEEDS seed kmers ('$' kmers)
+	
+	Indexes every read of the file with and without bloom filter gating
+	"""
+	(bloom_mb, kmer_size, barcode_start, barcode_end) = \
+		(int(bloom_mb), int(kmer_size), int(barcode_start), int(barcode_end))
+	exact = Kmer_utils.KmerIndex(kmer_size)
+	gated = Kmer_utils.KmerIndex(
+		kmer_size, bloom = Kmer_utils.BloomFilter(bloom_mb * 2**20))
+	times = {'exact' : 0, 'bloom' : 0}
+	fq = IO_utils.open_fastq(fq_fnames)
+	for reads_chunk in IO_utils.get_read_chunks(fq, BUFFER_SIZE = BUFFER_SIZE):
+		barcodes = Kmer_utils.get_barcode_array(
+			[read for (read, _) in reads_chunk], barcode_start, barcode_end)
+		codes, rows = Kmer_utils.get_cyclic_kmer_codes_batch(barcodes, kmer_size)
+		offsets = np.array(
+			[offset for (_, offset) in reads_chunk], dtype = np.int64)[rows]
+		for (name, kmer_index) in [('exact', exact), ('bloom', gated)]:
+			start_time = time.time()
+			kmer_index.add(codes, offsets)
+			times[name] += time.time() - start_time
+	fq.close()
+	for kmer_index in [exact, gated]:
+		kmer_index.group_postings()
+	
+	get_memory = lambda kmer_index: sum([getattr(kmer_index, name).nbytes for \
+		name in Kmer_utils.KMER_INDEX_ARRAYS])
+	exact_counts = exact.counts[np.searchsorted(exact.codes, gated.codes)]
+	get_seeds = lambda kmer_index: [code for code in \
+		kmer_index.get_most_common().tolist() if \
+		Kmer_utils.is_sentinel_kmer(code, kmer_size)][0:NUM_SEEDS]
+	
+	results = {
+		'memory_exact' : get_memory(exact),
+		'memory_bloom' : get_memory(gated) + gated.bloom.bits.nbytes,
+		'time_exact' : times['exact'],
+		'time_bloom' : times['bloom'],
+		'kmers_exact' : exact.get_num_kmers(),
+		'kmers_bloom' : gated.get_num_kmers(),
+		'max_count_error' : int(np.max(np.abs(
+			gated.estimates - exact_counts), initial = 0)),
+		'seed_overlap' : len(set(get_seeds(exact)) & set(get_seeds(gated))) / \
+			max(1, len(get_seeds(exact)))}
+	for name in ['exact', 'bloom']:
+		print('%s\t%i kmers indexed\t%0.1f MB\t%0.2f seconds' % (name, 
+			results['kmers_%s' % name], 
+			results['memory_%s' % name] / 2**20, 
+			results['time_%s' % name]))
+	print('largest error of corrected counts\t%i' % results['max_count_error'])
+	print('overlap of top %i seeds\t%0.4f' % (NUM_SEEDS, results['seed_overlap']))
+	return results
+
+def check_successive_cycles():
+	"""
+	Two barcodes share a seed edge. The seed edge weight (12) is less than
+	the sum of their weights (10 and 8), so after the first cycle is 
+	subtracted the second cycle has weight 2, and the seed edge is used up.
+	Checks that both backends find exactly the cycles of the original 
+	(Path based) search: every find_all_cyclic_paths must see the weights
+	left by the cycles before
+	"""
+	KMER_SIZE = 7
+	EXPECTED = [('ACGTACGTTTGA', 10), ('ACGTACCAGGTC', 2)]
+	
+	counts = {}
+	for (barcode, weight) in [('ACGTACGTTTGA', 10), ('ACGTACCAGGTC', 8)]:
+		for code in Kmer_utils.get_cyclic_kmer_codes(
+			[None, barcode], KMER_SIZE, 0, len(barcode)):
+			counts[code] = counts.get(code, 0) + weight
+	seed = Kmer_utils.encode_kmer('$ACGTAC')
+	counts[seed] = 12
+	codes = np.array(sorted(counts), dtype = Kmer_utils.get_dtype(KMER_SIZE))
+	weights = np.array([counts[code] for code in codes.tolist()])
+	
+	graphs = {
+		'objects' : Graph([Edge(
+			Kmer_utils.decode_kmer(code, KMER_SIZE)[0:-1],
+			Kmer_utils.decode_kmer(code, KMER_SIZE)[1:],
+			counts[code]) for code in codes.tolist()]),
+		'arrays' : ArrayGraph(codes, weights, KMER_SIZE)}
+	seed = Kmer_utils.decode_kmer(seed, KMER_SIZE)
+	for (name, graph) in graphs.items():
+		cycles = []
+		for path in graph.find_all_cyclic_paths(seed[0:-1], seed[1:], 13):
+			if(not path.is_cycle() or len(cycles) > len(EXPECTED)):
+				break
+			cycles.append(
+				(path.get_sequence_circular(), path.get_cycle_weight()))
+		assert cycles == EXPECTED, \
+			'%s backend found cycles %s, expected %s' % \
+			(name, cycles, EXPECTED)
+	print('successive cycles\t%s (both backends)' % EXPECTED)
+
+def benchmark_graph(
+	fq_fnames,
+	kmer_size = 8,
+	barcode_start = 0,
+	barcode_end = 12,
+	NUM_READS = 100000,
+	NUM_SEEDS = 100,
+	DEPTH = 10):
+	"""
+	Args
+		fq_fnames (str): barcodes fastq file name(s)
+		kmer_size, barcode_start, barcode_end (int): as for Split_reads
+	Returns
+		dict of graph backend -> (build seconds, search seconds)
+	
+	Indexes the first NUM_READS reads and, for the NUM_SEEDS most common 
+	seed kmers, builds the subgraph of the reads that contain the seed and
+	finds up to DEPTH cycles, as Split_reads.find_path_from_kmer. Checks 
+	that both backends find the same cycles, after check_successive_cycles
+	"""
+	check_successive_cycles()
+	(kmer_size, barcode_start, barcode_end) = \
+		(int(kmer_size), int(barcode_start), int(barcode_end))
+	fq = IO_utils.open_fastq(fq_fnames)
+	reads_chunk = next(IO_utils.get_read_chunks(fq, BUFFER_SIZE = NUM_READS))
+	barcodes = Kmer_utils.get_barcode_array(
+		[read for (read, _) in reads_chunk], barcode_start, barcode_end)
+	codes, rows = Kmer_utils.get_cyclic_kmer_codes_batch(barcodes, kmer_size)
+	kmer_index = Kmer_utils.KmerIndex(kmer_size)
+	offsets = np.array([offset for (_, offset) in reads_chunk], dtype = np.int64)
+	kmer_index.add(codes, offsets[rows])
+	kmer_index.group_postings()
+	seeds = [code for code in kmer_index.get_most_common().tolist() if \
+		Kmer_utils.is_sentinel_kmer(code, kmer_size)][0:NUM_SEEDS]
+	
+	subgraphs = []
+	for seed in seeds:
+		offsets = sorted(kmer_index.get_postings(seed).tolist(), reverse = True)
+		reads = [read for (read, _) in IO_utils.read_fastq_random(fq, offsets)]
+		read_kmers, _ = Kmer_utils.get_cyclic_kmer_codes_batch(
+			Kmer_utils.get_barcode_array(reads, barcode_start, barcode_end),
+			kmer_size)
+		subgraphs.append(np.unique(read_kmers, return_counts = True))
+	fq.close()
+	
+	def build_objects(codes, counts):
+		edges = []
+		for (kmer, count) in zip(codes, counts):
+			kmer = Kmer_utils.decode_kmer(kmer, kmer_size)
+			edges.append(Edge(kmer[0:-1], kmer[1:], int(count)))
+		return Graph(edges)
+	builders = {
+		'objects' : build_objects,
+		'arrays' : lambda codes, counts: ArrayGraph(codes, counts, kmer_size)}
+	
+	results = {}
+	cycles = {}
+	for (name, build) in builders.items():
+		(build_time, search_time) = (0, 0)
+		cycles[name] = []
+		for (i, (seed, (codes, counts))) in enumerate(zip(seeds, subgraphs)):
+			start_time = time.time()
+			graph = build(codes, counts)
+			build_time += time.time() - start_time
+			seed = Kmer_utils.decode_kmer(seed, kmer_size)
+			start_time = time.time()
+			for (depth, path) in enumerate(graph.find_all_cyclic_paths(
+				seed[0:-1], seed[1:], barcode_end - barcode_start + 1)):
+				if(not path.is_cycle() or depth >= DEPTH):
+					break
+				cycles[name].append((i, depth,
+					path.get_sequence_circular(), path.get_cycle_weight()))
+			search_time += time.time() - start_time
+		results[name] = (build_time, search_time)
+		print('%s\tbuild %0.2f seconds\tsearch %0.2f seconds' % \
+			(name, build_time, search_time))
+	assert cycles['objects'] == cycles['arrays'], \
+		'Graph backends found different cycles'
+	print('%i seeds\t%i cycles (identical)\t%i cycles past the first' % \
+		(len(seeds), len(cycles['arrays']),
+		sum(depth > 0 for (i, depth, seq, weight) in cycles['arrays'])))
+	
+	#exact max bottleneck cycles (--cycle_search dp), vs the first cycle
+	#of the depth first search
+	first_cycles = {}
+	for (name, method) in [
+		('dfs', ArrayGraph.find_all_cyclic_paths),
+		('dp', ArrayGraph.find_all_max_bottleneck_cycles)]:
+		first_cycles[name] = set()
+		search_time = 0
+		for (seed, (codes, counts)) in zip(seeds, subgraphs):
+			graph = ArrayGraph(codes, counts, kmer_size)
+			seed = Kmer_utils.decode_kmer(seed, kmer_size)
+			start_time = time.time()
+			for path in method(
+				graph, seed[0:-1], seed[1:], barcode_end - barcode_start + 1):
+				if(path.is_cycle()):
+					first_cycles[name].add(
+						(path.get_sequence_circular(), path.get_cycle_weight()))
+				break
+			search_time += time.time() - start_time
+		results['first_cycle_%s' % name] = search_time
+		print('%s\tfirst cycle of every seed\t%0.2f seconds' % \
+			(name, search_time))
+	results['dp_agreement'] = \
+		len(first_cycles['dfs'] & first_cycles['dp']) / \
+		max(1, len(first_cycles['dfs']))
+	print('first cycles found by dfs that dp also finds\t%0.4f' % \
+		results['dp_agreement'])
+	return results
+
+if __name__ == "__main__":
+	benchmarks = {
+		'parsers' : benchmark_fastq_parsers,
+		'kmers' : benchmark_kmer_codes,
+		'postings' : benchmark_postings,
+		'sketch' : benchmark_sketch,
+		'bloom' : benchmark_bloom,
+		'graph' : benchmark_graph,
+		'cycles' : check_successive_cycles}
+	benchmarks[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,110 @@
+"""
+Akshay Tambe
+Pachter and Doudna groups
+
+Column_utils.py
+Barcode and UMI columns of every read, as fixed width arrays
+	One sequential pass over the barcodes file extracts, for every record:
+		barcodes: barcode_start:barcode_end, as symbol codes (see
+			Kmer_utils.get_barcode_array). shape (num_reads, barcode length)
+		umis: umi_start:umi_end, as ascii padded with PAD. shape
+			(num_reads, umi length)
+	Both are uint8 .npy files. Symbol codes take 3 bits (N is kept), so
+	they are not packed further
+	Later stages memory map the columns (worker processes share them
+	through the page cache) and slice rows by record number, instead of
+	seeking to and parsing fastq records
+"""
+import numpy as np
+
+from sircel.utils import IO_utils, Kmer_utils
+
+BUFFER_SIZE = 2**16
+PAD = Kmer_utils.PAD
+
+def build_columns(
+	fq,
+	num_records,
+	fname_prefix,
+	barcode_start,
+	barcode_end,
+	umi_start,
+	umi_end):
+	"""
+	Args
+		fq (file object): barcodes fastq, opened in binary mode
+		num_records (int): number of records in fq (see IO_utils.index_fastq)
+		fname_prefix (str): columns are saved to [prefix]_barcodes.npy and
+			[prefix]_umis.npy
+		barcode_start, barcode_end, umi_start, umi_end (int): coordinates
+			within the read sequence
+	Returns
+		fname_prefix
+	"""
+	fnames = get_column_fnames(fname_prefix)
+	barcodes = np.lib.format.open_memmap(
+		fnames['barcodes'],
+		mode = 'w+',
+		dtype = np.uint8,
+		shape = (num_records, barcode_end - barcode_start))
+	umis = np.lib.format.open_memmap(
+		fnames['umis'],
+		mode = 'w+',
+		dtype = np.uint8,
+		shape = (num_records, umi_end - umi_start))
+
+	first_record = 0
+	for reads_chunk in IO_utils.get_read_chunks(
+		fq, BUFFER_SIZE = BUFFER_SIZE, decode = False):
+		reads = [read for (read, _) in reads_chunk]
+		last_record = first_record + len(reads)
+		barcodes[first_record:last_record] = Kmer_utils.get_barcode_array(
+			reads, barcode_start, barcode_end)
+		umis[first_record:last_record] = get_umi_array(reads, umi_start, umi_end)
+		first_record = last_record
+	assert first_record == num_records, \
+		'Expected %i records, read %i' % (num_records, first_record)
+	barcodes.flush()
+	umis.flush()
+	return fname_prefix
+
+def get_column_fnames(fname_prefix):
+	"""
+	Returns dict
+		'barcodes', 'umis' -> .npy file names
+	"""
+	return {
+		'barcodes' : '%s_barcodes.npy' % fname_prefix,
+		'umis' : '%s_umis.npy' % fname_prefix}
+
+def get_umi_array(reads, start, end):
+	"""
+	Args
+		reads (list): fastq entries as lists of lines (bytes)
+		start, end (int): UMI coordinates within the read sequence
+	Returns np.array (uint8)
+		shape (len(reads), end - start), ascii UMI of each read, padded
+		with PAD past the end of a read
+	"""
+	width = end - start
+	joined = b''.join(
+		[read[1][start:end].ljust(width, bytes([PAD])) for read in reads])
+	return np.frombuffer(joined, dtype = np.uint8).reshape(len(reads), width)
+
+def get_umi(row):
+	"""
+	Args
+		row (np.array): a row of the UMI column
+	Returns bytes
+	"""
+	return row.tobytes().rstrip(bytes([PAD]))
+
+def load_column(fname_prefix, column):
+	"""
+	Args
+		fname_prefix (str): as for build_columns
+		column (str): 'barcodes' or 'umis'
+	Returns np.array
+		the column as a read-only memory map
+	"""
+	return np.load(get_column_fnames(fname_prefix)[column], mmap_mode = 'r')
@@ -3,13 +3,15 @@ Akshay Tambe
 Pachter and Doudna groups
 UC Berkeley
 
-Dropseq_utils.py
+Graph_utils.py
 A few useful objects for working with single-cell barcode
 data as de Bruijn graphs
 """
 import sys
 import numpy as np
 
+from sircel.utils import Kmer_utils
+
 class Edge:
 	"""
 	An edge in a de Bruijn graph
@@ -159,6 +161,93 @@ class Path:
 			return True
 		return False
 
+class LinkedPath:
+	"""
+	A path during a cycle search, as a linked list from the last edge back
+	to the first. Extending a path is O(1) and shares the edges of the 
+	path it extends (nothing is copied or re-validated). Length, start and
+	end nodes and the weight of the lowest-weight edge are kept as the 
+	path grows, so Path objects are only built for the paths returned
+	Attributes
+		edge: the last edge (an Edge, or an edge id for ArrayGraph)
+		parent (LinkedPath): the path without its last edge, or None
+		length (int): # edges
+		start_node, end_node: node of the first edge, neighbor of the last
+		weight: weight of the lowest-weight edge
+	
+	Edge weights must not change while a LinkedPath is in use
+	"""
+	__slots__ = ['edge', 'parent', 'length', 'start_node', 'end_node', 'weight']
+	
+	def __init__(self, _edge, _node, _neighbor, _weight, _parent = None):
+		self.edge = _edge
+		self.parent = _parent
+		self.end_node = _neighbor
+		if(_parent is None):
+			self.length = 1
+			self.start_node = _node
+			self.weight = _weight
+		else:
+			self.length = _parent.length + 1
+			self.start_node = _parent.start_node
+			self.weight = min(_parent.weight, _weight)
+	
+	def extend(self, edge, neighbor, weight):
+		return LinkedPath(edge, self.end_node, neighbor, weight, self)
+	
+	def get_length(self):
+		return self.length
+	
+	def is_cycle(self):
+		return (self.start_node == self.end_node)
+	
+	def get_cycle_weight(self):
+		"""
+		Returns float
+			0 if the path is not a cycle
+			the path weight otherwise
+		"""
+		if(not self.is_cycle()):
+			return 0.0
+		return self.weight
+	
+	def get_edges(self):
+		edges = []
+		path = self
+		while(path is not None):
+			edges.append(path.edge)
+			path = path.parent
+		edges.reverse()
+		return edges
+	
+	def is_possible_cycle(self, cycle_length):
+		"""
+		As Path.is_possible_cycle (for str nodes)
+		"""
+		kmer_size = len(self.start_node)
+		if(self.length < (cycle_length - kmer_size)):
+			return True
+		if(self.is_cycle()):
+			return True
+		
+		overlap = self.length - (cycle_length - kmer_size)
+		return ((self.start_node[0:overlap]) == 
+			(self.end_node[kmer_size - overlap:]))
+	
+	def to_path(self):
+		return Path(self.get_edges())
+
+def get_linked_path(edges):
+	"""
+	Args
+		edges (list): Edge objects of a valid path
+	Returns LinkedPath
+	"""
+	path = None
+	for edge in edges:
+		path = LinkedPath(edge, edge.node, edge.neighbor, edge.get_weight(), path)
+	return path
+
 class Graph:
 	def __init__(self, _edges_lst):
 		#create dict of edge objects
@@ -231,6 +320,19 @@ class Graph:
 			The total number of possible paths is given by: 
 				4**(expected_path_length - kmer_size)
 		"""
+		is_cycle, path = self.search_cyclic_path(
+			get_linked_path(current_path.edges), 
+			expected_path_length)
+		return(is_cycle, path.to_path())
+	
+	def search_cyclic_path(self, current_path, expected_path_length):
+		"""
+		find_cyclic_path on LinkedPaths. Each extension of the current path
+		is O(1)
+		Returns
+			Cycle (boolean): whether or not a cycle was found
+			Path (LinkedPath): the best path
+		"""
 		#check if path is too long (fail condition)		
 		if(current_path.get_length() > expected_path_length + 1):
 			return(False, current_path)	
@@ -247,23 +349,24 @@ class Graph:
 			
 			(possible_self_edges,
 				updated_path) = self.check_possible_self_edges(
-				current_path, 
+				current_path.to_path(), 
 				expected_path_length)
 			if(not possible_self_edges):
 				return(False, current_path)
 			else:
-				return(True, updated_path)
+				return(True, get_linked_path(updated_path.edges))
 
 		#else return best cycle of all outgoing edges (continue recursion)
-		current_node = current_path.get_end_node()
+		current_node = current_path.end_node
 		outgoing_edges = self.get_outgoing_edges_sorted(current_node)
 		#outgoing_edges is sorted in descending order by weight
 		if(len(outgoing_edges) == 0):
 			return (False, current_path)
 		best_path = current_path
 		for (i, outgoing_edge) in enumerate(outgoing_edges):
-			downstream_path = Path(current_path.edges + [outgoing_edge])
-			is_cycle, path = self.find_cyclic_path(
+			downstream_path = current_path.extend(
+				outgoing_edge, outgoing_edge.neighbor, outgoing_edge.get_weight())
+			is_cycle, path = self.search_cyclic_path(
 				downstream_path, 
 				expected_path_length)
 			if(path.get_cycle_weight() > best_path.get_cycle_weight()):
@@ -303,14 +406,17 @@ class Graph:
 	def find_all_cyclic_paths(self, start_node, start_neighbor, expected_path_length):
 		key = (start_node, start_neighbor)
 		if(key not in self.edges):
-			raise StopIteration
+			return
 		
 		start_edge = self.edges[key]
-		initial_path = Path([start_edge])
 		while(True):
-			cycle, path = self.find_cyclic_path(initial_path, expected_path_length)			
+			#LinkedPath keeps edge weights from when it is built, so the 
+			#start of the search is rebuilt after every decrement
+			cycle, path = self.search_cyclic_path(
+				get_linked_path([start_edge]), expected_path_length)
+			path = path.to_path()
 			if(path.get_length() != expected_path_length):
-				raise StopIteration
+				return
 			elif(cycle):
 				yield path
 			#decrement edges in graph by cycle weight
@@ -324,3 +430,447 @@ class Graph:
 		
 		
 
+class ArrayGraph:
+	"""
+	A de Bruijn graph over integer kmer codes (see Kmer_utils), with the
+	same cycle search as Graph
+	Attributes
+		k (int): kmer size. Nodes are (k - 1)-mers
+		node_codes (np.array): code of every node, sorted. Node ids index
+			this array
+		edge_codes (np.array): kmer code of every edge (not self edges), 
+			sorted
+		sources, targets (np.array): node id of the node / neighbor of 
+			every edge
+		weights (np.array): weight (int64) of every edge
+		outgoing, indptr (np.array): CSR adjacency. The outgoing edges of 
+			node i are outgoing[indptr[i]:indptr[i + 1]], in alphabet order
+			(A, C, G, T, $) of their last symbol, as Graph.get_outgoing_edges
+		self_weights (np.array): weight of the self edge of every node, or
+			-1 if it has none
+		incoming, in_indptr (np.array): CSR of the outgoing edges by 
+			neighbor, built by get_view
+	
+	Paths are LinkedPaths of edge ids. A self edge of node i in a path is ~i
+	"""
+	def __init__(self, _codes, _weights, _k):
+		"""
+		Args
+			_codes (np.array): distinct kmer codes, sorted (np.unique)
+			_weights (np.array): weight of each kmer
+			_k (int): kmer size
+		"""
+		self.k = _k
+		codes = np.asarray(_codes, dtype = np.uint64)
+		weights = np.asarray(_weights, dtype = np.int64)
+		node_mask = np.uint64(Kmer_utils.get_mask(_k - 1))
+		nodes = codes >> np.uint64(Kmer_utils.BITS)
+		neighbors = codes & node_mask
+		self.node_codes = np.unique(np.concatenate((nodes, neighbors)))
+		
+		is_self_edge = nodes == neighbors
+		self.self_weights = np.full(len(self.node_codes), -1, dtype = np.int64)
+		self.self_weights[np.searchsorted(
+			self.node_codes, nodes[is_self_edge])] = weights[is_self_edge]
+		
+		self.edge_codes = codes[~is_self_edge]
+		self.weights = weights[~is_self_edge]
+		self.sources = np.searchsorted(self.node_codes, nodes[~is_self_edge])
+		self.targets = np.searchsorted(self.node_codes, neighbors[~is_self_edge])
+		
+		#only edges to A, C, G, T, $ are outgoing edges
+		is_outgoing = (self.edge_codes & np.uint64(7)) <= Kmer_utils.SENTINEL
+		outgoing = np.flatnonzero(is_outgoing)
+		self.outgoing = outgoing
+		self.indptr = np.searchsorted(
+			self.sources[outgoing], np.arange(len(self.node_codes) + 1))
+		self.incoming = None
+		self.in_indptr = None
+	
+	def get_num_edges(self):
+		return len(self.edge_codes) + int(np.count_nonzero(self.self_weights >= 0))
+	
+	def get_view(self, start_node, start_neighbor, expected_path_length):
+		"""
+		Args
+			start_node, start_neighbor (str): the start edge, as for 
+				find_all_cyclic_paths
+			expected_path_length (int): # edges in cyclic paths
+		Returns ArrayGraph
+			a copy of the part of this graph that cycles of up to 
+			expected_path_length + 1 edges through the start edge can use,
+			or None if there is no such edge. Searches (which decrement 
+			weights) on the view leave this graph unchanged
+		
+		An edge is kept if the distance from the start edge to it, plus 
+		the distance from it back to the start edge, is small enough. 
+		Distances come from breadth first searches over the outgoing 
+		edges (CSR), which only visit nodes near the start edge
+		"""
+		start_edge = self.get_edge_id(start_node, start_neighbor)
+		if(start_edge is None):
+			return None
+		if(self.in_indptr is None):
+			#incoming edges of every node (CSR), for backward searches
+			self.incoming = self.outgoing[np.argsort(
+				self.targets[self.outgoing], kind = 'stable')]
+			self.in_indptr = np.searchsorted(
+				self.targets[self.incoming], np.arange(len(self.node_codes) + 1))
+		max_distance = expected_path_length - 1
+		distances_from = self.get_distances(
+			self.targets[start_edge], 
+			self.outgoing, self.indptr, self.targets, max_distance)
+		distances_to = self.get_distances(
+			self.sources[start_edge], 
+			self.incoming, self.in_indptr, self.sources, max_distance)
+		
+		edges = self.outgoing[distances_from[self.sources[self.outgoing]] + 1 + \
+			distances_to[self.targets[self.outgoing]] <= expected_path_length]
+		edges = np.union1d(edges, [start_edge])
+		nodes = np.flatnonzero((self.self_weights >= 0) & \
+			(distances_from + distances_to <= max_distance))
+		self_edge_codes = (self.node_codes[nodes] << np.uint64(Kmer_utils.BITS)) | \
+			(self.node_codes[nodes] & np.uint64(7))
+		
+		codes = np.concatenate((self.edge_codes[edges], self_edge_codes))
+		weights = np.concatenate((self.weights[edges], self.self_weights[nodes]))
+		order = np.argsort(codes)
+		return ArrayGraph(codes[order], weights[order], self.k)
+	
+	def get_distances(self, start, edges, indptr, ends, max_distance):
+		"""
+		Args
+			start (int): node id
+			edges, indptr (np.array): CSR adjacency (outgoing or incoming)
+			ends (np.array): the node at the other end of every edge
+		Returns np.array
+			# edges from start to every node, max_distance + 1 if further
+		"""
+		distances = np.full(len(self.node_codes), max_distance + 1, dtype = np.int64)
+		distances[start] = 0
+		frontier = np.array([start], dtype = np.int64)
+		for distance in range(1, max_distance + 1):
+			(first, last) = (indptr[frontier], indptr[frontier + 1])
+			num_edges = last - first
+			if(num_edges.sum() == 0):
+				break
+			positions = np.repeat(first - np.cumsum(num_edges) + num_edges, 
+				num_edges) + np.arange(num_edges.sum())
+			neighbors = ends[edges[positions]]
+			distances[neighbors[distances[neighbors] > distance]] = distance
+			frontier = np.flatnonzero(distances == distance)
+		return distances
+	
+	def get_total_weight(self):
+		return int(self.weights.sum() + \
+			self.self_weights[self.self_weights >= 0].sum())
+	
+	def get_edge_id(self, node, neighbor):
+		"""
+		Args
+			node, neighbor (str): as for Graph.find_all_cyclic_paths
+		Returns int
+			edge id, or None if there is no such edge (or it is a self edge)
+		"""
+		code = np.uint64(Kmer_utils.encode_kmer(node + neighbor[-1]))
+		i = int(np.searchsorted(self.edge_codes, code))
+		if(node[1:] != neighbor[0:-1] or 
+			i >= len(self.edge_codes) or 
+			self.edge_codes[i] != code):
+			return None
+		return i
+	
+	def find_all_cyclic_paths(self, start_node, start_neighbor, expected_path_length):
+		"""
+		As Graph.find_all_cyclic_paths. Yields Path objects
+		"""
+		start_edge = self.get_edge_id(start_node, start_neighbor)
+		if(start_edge is None):
+			return
+		
+		search = CycleSearch(self, expected_path_length)
+		while(True):
+			search.weights = self.weights.tolist()
+			path = search.find_cyclic_path(search.get_linked_path([start_edge]))
+			edges = path.get_edges()
+			cycle_weight = path.get_cycle_weight()
+			if(len(edges) != expected_path_length):
+				return
+			elif(path.is_cycle()):
+				yield self.get_path(edges, cycle_weight)
+			#decrement edges in graph by cycle weight
+			edges = np.array([e for e in edges if e >= 0], dtype = np.int64)
+			np.subtract.at(self.weights, edges, cycle_weight)
+	
+	def find_all_max_bottleneck_cycles(self, start_node, start_neighbor, expected_path_length):
+		"""
+		As find_all_cyclic_paths, but each cycle is the exact maximum 
+		bottleneck cycle of expected_path_length edges through the start
+		edge (see find_max_bottleneck_cycle). Yields Path objects until 
+		no cycle of positive weight is left
+		"""
+		start_edge = self.get_edge_id(start_node, start_neighbor)
+		if(start_edge is None):
+			return
+		while(True):
+			(edges, cycle_weight) = self.find_max_bottleneck_cycle(
+				start_edge, expected_path_length)
+			if(edges is None):
+				return
+			yield self.get_path(edges, cycle_weight)
+			#decrement edges in graph by cycle weight
+			edges = np.array([e for e in edges if e >= 0], dtype = np.int64)
+			np.subtract.at(self.weights, edges, cycle_weight)
+	
+	def find_max_bottleneck_cycle(self, start_edge, expected_path_length):
+		"""
+		Args
+			start_edge (int): edge id
+			expected_path_length (int): # edges in the cycle
+		Returns
+			edges (list): edge ids of the cycle, starting with start_edge,
+				or None if there is no cycle of positive weight
+			cycle_weight (int): weight of its lowest-weight edge
+		
+		Dynamic programming over (steps, node), for walks of 
+		expected_path_length - 1 steps from the neighbor of start_edge back
+		to its node. A step follows an outgoing edge, or a self edge. As in
+		Graph.check_possible_self_edges, self edges pad a shorter cycle to
+		length and take the weight of the cycle
+			1. the largest bottleneck (lowest edge weight) of any such walk
+			2. of the walks over edges at least that heavy, the one with 
+				the largest total weight (self edges add nothing). Among 
+				cycles of equal bottleneck, this prefers the best supported
+		States are pruned if they cannot get back to the start node in the
+		steps that are left. Takes O(expected_path_length * # edges) time 
+		and no recursion
+		"""
+		num_steps = expected_path_length - 1
+		start_weight = int(self.weights[start_edge])
+		if(start_weight <= 0 or num_steps < 1):
+			return (None, 0)
+		
+		(bottleneck, _) = self.walk_dp(
+			start_edge, num_steps, 1, np.minimum, False)
+		if(bottleneck <= 0):
+			return (None, 0)
+		(_, edges) = self.walk_dp(
+			start_edge, num_steps, bottleneck, np.add, True)
+		return (edges, bottleneck)
+	
+	def walk_dp(self, start_edge, num_steps, min_weight, combine, get_edges):
+		"""
+		Args
+			start_edge (int): edge id
+			num_steps (int): # edges (or self edges) in a walk from the
+				neighbor of start_edge back to its node
+			min_weight (int): only edges of at least this weight are used
+			combine (np.ufunc): value of a walk extended by an edge, from
+				the value of the walk and the weight of the edge. The value
+				of the empty walk is the weight of start_edge. Self edges
+				keep the value of the walk
+			get_edges (bool): whether to trace back the best walk
+		Returns
+			value (int): value of the best walk, or -1 if there is none
+			edges (list): edge ids of the cycle of start_edge and the best 
+				walk (~i for a self edge of node i), if get_edges
+		"""
+		num_nodes = len(self.node_codes)
+		start = int(self.sources[start_edge])
+		first = int(self.targets[start_edge])
+		outgoing = self.outgoing[self.weights[self.outgoing] >= min_weight]
+		sources = self.sources[outgoing]
+		targets = self.targets[outgoing]
+		weights = self.weights[outgoing]
+		has_self_edge = self.self_weights >= 0
+		
+		#can_reach[s]: nodes with a walk of s steps to the start node
+		can_reach = np.zeros((num_steps + 1, num_nodes), dtype = bool)
+		can_reach[0, start] = True
+		for s in range(1, num_steps + 1):
+			can_reach[s, sources[can_reach[s - 1, targets]]] = True
+			can_reach[s] |= can_reach[s - 1] & has_self_edge
+		if(not can_reach[num_steps, first]):
+			return (-1, None)
+		
+		values = np.full(num_nodes, -1, dtype = np.int64)
+		values[first] = self.weights[start_edge]
+		predecessors = None
+		if(get_edges):
+			predecessors = np.empty((num_steps, num_nodes), dtype = np.int64)
+		for t in range(num_steps):
+			steps_left = num_steps - t - 1
+			live = np.flatnonzero(
+				(values[sources] >= 0) & can_reach[steps_left, targets])
+			candidates = combine(values[sources[live]], weights[live])
+			next_values = np.full(num_nodes, -1, dtype = np.int64)
+			np.maximum.at(next_values, targets[live], candidates)
+			wait = np.flatnonzero(has_self_edge & 
+				(values > next_values) & can_reach[steps_left])
+			if(get_edges):
+				#ties go to the lowest edge id
+				best = live[candidates == next_values[targets[live]]]
+				(best_targets, first_best) = np.unique(
+					targets[best], return_index = True)
+				predecessors[t, best_targets] = outgoing[best[first_best]]
+				predecessors[t, wait] = ~wait
+			next_values[wait] = values[wait]
+			values = next_values
+		
+		if(not get_edges or values[start] < 0):
+			return (int(values[start]), None)
+		edges = []
+		node = start
+		for t in reversed(range(num_steps)):
+			e = int(predecessors[t, node])
+			edges.append(e)
+			if(e >= 0):
+				node = int(self.sources[e])
+		assert node == first, 'Invalid cycle'
+		edges.append(start_edge)
+		edges.reverse()
+		return (int(values[start]), edges)
+	
+	def get_path(self, edges, cycle_weight):
+		"""
+		Returns a Path of Edge objects for a list of edge ids
+		"""
+		node_size = self.k - 1
+		decode = lambda node_id: Kmer_utils.decode_kmer(
+			self.node_codes[node_id], node_size)
+		path_edges = []
+		for e in edges:
+			if(e < 0):
+				node = decode(~e)
+				path_edges.append(Edge(node, node, cycle_weight))
+			else:
+				path_edges.append(Edge(
+					decode(self.sources[e]), 
+					decode(self.targets[e]), 
+					int(self.weights[e])))
+		return Path(path_edges)
+
+class CycleSearch:
+	"""
+	The recursion of Graph.find_cyclic_path over an ArrayGraph. Edge 
+	weights are copied to a list for the search (they only change between
+	searches)
+	Attributes
+		graph (ArrayGraph)
+		expected_path_length (int): # edges in cyclic paths
+		weights (list): current edge weights
+		sources, targets, node_codes, indptr, outgoing (list): the arrays 
+			of graph, as lists
+	"""
+	def __init__(self, _graph, _expected_path_length):
+		self.graph = _graph
+		self.expected_path_length = _expected_path_length
+		self.weights = None
+		self.sources = _graph.sources.tolist()
+		self.targets = _graph.targets.tolist()
+		self.node_codes = _graph.node_codes.tolist()
+		self.indptr = _graph.indptr.tolist()
+		self.outgoing = _graph.outgoing.tolist()
+		self.self_weights = _graph.self_weights.tolist()
+		self.node_size = _graph.k - 1
+	
+	def get_linked_path(self, edges):
+		"""
+		Args
+			edges (list): edge ids (~i for a self edge of node i)
+		Returns LinkedPath
+			self edges get the weight of the lowest-weight edge
+		"""
+		weight = min([self.weights[e] for e in edges if e >= 0])
+		path = None
+		for e in edges:
+			if(e < 0):
+				path = LinkedPath(e, ~e, ~e, weight, path)
+			else:
+				path = LinkedPath(
+					e, self.sources[e], self.targets[e], self.weights[e], path)
+		return path
+	
+	def is_possible_cycle(self, path):
+		"""
+		As Path.is_possible_cycle, comparing node codes
+		"""
+		overlap = path.length - (self.expected_path_length - self.node_size)
+		if(overlap < 0):
+			return True
+		if(path.is_cycle()):
+			return True
+		if(overlap >= self.node_size):
+			return False
+		start_code = self.node_codes[path.start_node]
+		end_code = self.node_codes[path.end_node]
+		return (start_code >> (Kmer_utils.BITS * (self.node_size - overlap))) == \
+			(end_code & Kmer_utils.get_mask(overlap))
+	
+	def find_cyclic_path(self, current_path):
+		"""
+		Args
+			current_path (LinkedPath): of edge ids
+		Returns LinkedPath
+			the best path, as Graph.find_cyclic_path. Graph also returns
+			whether it is a cycle, but for some cycles it rejects says it is
+			not. Callers only use Path.is_cycle of the result
+		"""
+		expected_path_length = self.expected_path_length
+		path_length = current_path.length
+		is_cycle = current_path.is_cycle()
+		if(path_length > expected_path_length + 1):
+			return current_path
+		if(not self.is_possible_cycle(current_path)):
+			return current_path
+		if(is_cycle and abs(path_length - expected_path_length) <= 1):
+			return current_path
+		if(is_cycle and path_length < expected_path_length):
+			return self.check_possible_self_edges(current_path)
+		
+		current_node = current_path.end_node
+		outgoing_edges = sorted(
+			self.outgoing[self.indptr[current_node]:self.indptr[current_node + 1]],
+			key = self.weights.__getitem__,
+			reverse = True)#sorted by edge weight (descending)
+		if(len(outgoing_edges) == 0):
+			return current_path
+		best_path = current_path
+		best_weight = 0.0
+		for (i, outgoing_edge) in enumerate(outgoing_edges):
+			path = self.find_cyclic_path(current_path.extend(
+				outgoing_edge, 
+				self.targets[outgoing_edge], 
+				self.weights[outgoing_edge]))
+			if(path.get_cycle_weight() > best_weight):
+				best_path = path
+				best_weight = path.get_cycle_weight()
+			if(i < len(outgoing_edges) - 1 and \
+				best_path.is_cycle() and \
+				best_weight > self.weights[outgoing_edges[i + 1]]):
+				break
+		return best_path
+	
+	def check_possible_self_edges(self, current_path):
+		"""
+		As Graph.check_possible_self_edges
+		"""
+		edges = current_path.get_edges()
+		best_node = None
+		best_weight = None
+		for e in edges:
+			node = self.sources[e]
+			self_weight = self.self_weights[node]
+			if(self_weight >= 0 and 
+				(best_weight is None or self_weight > best_weight)):
+				(best_node, best_weight) = (node, self_weight)
+		if(best_node is None):
+			return current_path
+		num_self_edges_needed = self.expected_path_length - len(edges)
+		
+		new_edges = []
+		for e in edges:
+			if(self.sources[e] == best_node):
+				new_edges += [~best_node] * num_self_edges_needed
+			new_edges.append(e)
+		return self.get_linked_path(new_edges)
@@ -0,0 +1,328 @@
+"""
+Akshay Tambe
+Pachter and Doudna groups
+
+Gzip_utils.py
+Read gzip / BGZF compressed fastq files in place, without writing a
+decompressed copy to disk
+	One pass over the compressed input builds a block-level index
+		BGZF files are indexed from their block headers alone
+		Plain (or multi-member) gzip files are decompressed once, and the
+			zlib state is checkpointed at regular intervals, within a fixed
+			memory budget
+		The decompressed data can be passed on during this pass (e.g. to 
+			index fastq records), so that nothing is decompressed twice
+	Every block of the index can then be decompressed independently, which
+	gives random access and lets sequential reads decompress in parallel
+"""
+import io
+import os
+import zlib
+import bisect
+import struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b'\x1f\x8b'
+READ_SIZE = 2**20
+INDEX_READ_SIZE = 2**16
+MIN_CHECKPOINT_SPACING = 2**20
+CHECKPOINT_SIZE = 40 * 2**10
+	#approximate memory of a zlib checkpoint (32kb window and inflate state)
+MAX_CHECKPOINT_BYTES = 2**27
+	#memory for the checkpoints of all plain gzip files of an index
+CACHE_BLOCKS = 16
+
+Block = namedtuple('Block', ['file_num', 'start', 'end', 'offset', 'state'])
+	#file_num: index into GzipIndex.fnames
+	#start, end: compressed byte range of the block
+	#offset: uncompressed offset of the block in the concatenated stream
+	#state: None at a gzip member boundary, otherwise a zlib checkpoint
+
+_indices = {}
+
+class GzipIndex:
+	"""
+	Block-level index over a list of gzip files, read as one stream
+	Args
+		_fnames (list): gzip file names
+		_consumer (callable): if given, every file is decompressed while it
+			is indexed (BGZF files too), and consumer is called with the
+			decompressed data, in stream order
+	Attributes
+		fnames (list): gzip file names, in the order they are concatenated
+		blocks (list): Block tuples, sorted by uncompressed offset
+		offsets (list): uncompressed offset of each block
+		size (int): total uncompressed size
+	"""
+	def __init__(self, _fnames, _consumer = None):
+		self.fnames = list(_fnames)
+		self.consumer = _consumer
+		self.blocks = []
+		self.size = 0
+		for fname in self.fnames:
+			if not fname.endswith('.gz'):
+				raise TypeError('File does not appear to be gzipped: %s' % fname)
+		gzip_files = [file_num for (file_num, fname) in enumerate(self.fnames) \
+			if not is_bgzf(fname)]
+		#the checkpoint budget is shared by plain gzip files by size
+		checkpoints_left = MAX_CHECKPOINT_BYTES // CHECKPOINT_SIZE
+		bytes_left = sum([os.path.getsize(self.fnames[file_num]) \
+			for file_num in gzip_files])
+		for file_num in range(len(self.fnames)):
+			if file_num not in gzip_files:
+				self.index_bgzf(file_num)
+				continue
+			file_size = os.path.getsize(self.fnames[file_num])
+			max_checkpoints = checkpoints_left * file_size // max(bytes_left, 1)
+			checkpoints_left -= self.index_gzip(file_num, max_checkpoints)
+			bytes_left -= file_size
+		self.consumer = None
+		self.offsets = [block.offset for block in self.blocks]
+
+	def get_num_blocks(self):
+		return len(self.blocks)
+
+	def get_block_num(self, pos):
+		"""
+		Returns the index of the block that contains uncompressed offset pos
+		"""
+		return bisect.bisect_right(self.offsets, pos) - 1
+
+	def get_block_size(self, block_num):
+		if block_num == len(self.blocks) - 1:
+			return self.size - self.blocks[block_num].offset
+		return self.blocks[block_num + 1].offset - self.blocks[block_num].offset
+
+	def index_bgzf(self, file_num):
+		"""
+		BGZF blocks are complete gzip members. The compressed size of each
+		block is stored in its header and the uncompressed size in its
+		footer, so nothing needs to be decompressed (unless there is a
+		consumer)
+		"""
+		with open(self.fnames[file_num], 'rb') as reader:
+			start = 0
+			while True:
+				reader.seek(start)
+				header = reader.read(12)
+				if len(header) < 12:
+					break
+				(xlen,) = struct.unpack('<H', header[10:12])
+				block_size = get_bgzf_block_size(reader.read(xlen))
+				if self.consumer is not None:
+					reader.seek(start)
+					self.consumer(zlib.decompress(reader.read(block_size), 31))
+				reader.seek(start + block_size - 4)
+				(block_isize,) = struct.unpack('<I', reader.read(4))
+				if block_isize > 0:#skip the empty end-of-file block
+					self.blocks.append(
+						Block(file_num, start, start + block_size, self.size, None))
+					self.size += block_isize
+				start += block_size
+
+	def index_gzip(self, file_num, max_checkpoints):
+		"""
+		Decompresses the file once. A block starts at every gzip member,
+		and a zlib checkpoint is taken every spacing uncompressed bytes.
+		When there are more than max_checkpoints, every other checkpoint is
+		dropped (its block merges into the previous one) and the spacing
+		doubles
+		Returns int
+			number of checkpoints kept
+		"""
+		fname = self.fnames[file_num]
+		file_size = os.path.getsize(fname)
+		spacing = max(
+			MIN_CHECKPOINT_SPACING, 4 * file_size // max(max_checkpoints, 1))
+		num_checkpoints = 0
+
+		blocks = []
+		with open(fname, 'rb') as reader:
+			start = 0
+			while start < file_size:
+				reader.seek(start)
+				if reader.read(2) != GZIP_MAGIC:
+					break#trailing garbage / padding after the last member
+				reader.seek(start)
+				decompressor = zlib.decompressobj(31)
+				blocks.append(Block(file_num, start, None, self.size, None))
+				pos = start
+				last_checkpoint = self.size
+				while not decompressor.eof:
+					compressed = reader.read(INDEX_READ_SIZE)
+					if not compressed:
+						raise EOFError('Truncated gzip file: %s' % fname)
+					data = decompressor.decompress(compressed)
+					if self.consumer is not None:
+						self.consumer(data)
+					self.size += len(data)
+					pos += len(compressed)
+					if(not decompressor.eof and max_checkpoints > 0 and
+						self.size - last_checkpoint >= spacing):
+						blocks.append(Block(
+							file_num, pos, None, self.size, decompressor.copy()))
+						last_checkpoint = self.size
+						num_checkpoints += 1
+					if num_checkpoints > max_checkpoints:
+						checkpoints = [i for (i, block) in enumerate(blocks) \
+							if block.state is not None]
+						dropped = set(checkpoints[0::2])
+						blocks = [block for (i, block) in enumerate(blocks) \
+							if i not in dropped]
+						num_checkpoints -= len(dropped)
+						spacing *= 2
+				start = pos - len(decompressor.unused_data)
+
+		#a block ends where the next one starts
+		for (i, block) in enumerate(blocks):
+			end = blocks[i + 1].start if i < len(blocks) - 1 else file_size
+			blocks[i] = block._replace(end = end)
+		#drop empty members
+		blocks = [block for (i, block) in enumerate(blocks) if \
+			(blocks[i + 1].offset if i < len(blocks) - 1 else self.size) > \
+			block.offset]
+		self.blocks += blocks
+		return len([block for block in blocks if block.state is not None])
+
+def is_bgzf(fname):
+	"""
+	Returns true if the first block of fname has a BGZF ('BC') extra field
+	"""
+	with open(fname, 'rb') as reader:
+		header = reader.read(12)
+		if(len(header) < 12 or
+			header[0:2] != GZIP_MAGIC or
+			not header[3] & 4):#FEXTRA
+			return False
+		(xlen,) = struct.unpack('<H', header[10:12])
+		try:
+			get_bgzf_block_size(reader.read(xlen))
+		except ValueError:
+			return False
+	return True
+
+def get_bgzf_block_size(extra):
+	"""
+	Args
+		extra (bytes): the FEXTRA field of a gzip header
+	Returns int
+		total size of the BGZF block, including header and footer
+	"""
+	i = 0
+	while i + 4 <= len(extra):
+		(slen,) = struct.unpack('<H', extra[i + 2:i + 4])
+		if extra[i:i + 2] == b'BC' and slen == 2:
+			(bsize,) = struct.unpack('<H', extra[i + 4:i + 6])
+			return bsize + 1
+		i += 4 + slen
+	raise ValueError('Not a BGZF block')
+
+def get_index(fnames, consumer = None):
+	"""
+	Returns the GzipIndex for a list of files, building it on first use
+		Indices are cached per process. Building them in the parent before
+		a multiprocessing Pool is created lets the workers inherit them
+	consumer (callable) is passed to GzipIndex, so it is only called if 
+		the index is built by this call (see is_indexed)
+	"""
+	key = tuple(fnames)
+	if key not in _indices:
+		_indices[key] = GzipIndex(fnames, consumer)
+	return _indices[key]
+
+def is_indexed(fnames):
+	"""
+	Returns true if the GzipIndex for a list of files is already built
+	"""
+	return tuple(fnames) in _indices
+
+class GzipReader(io.RawIOBase):
+	"""
+	Seekable, read-only raw stream over the decompressed contents of a
+	GzipIndex. Wrap in io.BufferedReader for line iteration
+		Sequential reads decompress the next threads blocks in parallel
+		(zlib releases the GIL). Random reads decompress a single block
+		Recently used blocks are kept in a small cache
+	"""
+	def __init__(self, _index, _threads = 1):
+		self.index = _index
+		self.threads = max(1, _threads)
+		self.pos = 0
+		self.cache = {}
+		self.fds = [os.open(fname, os.O_RDONLY) for fname in self.index.fnames]
+		self.executor = None
+		if self.threads > 1:
+			self.executor = ThreadPoolExecutor(self.threads)
+
+	def readable(self):
+		return True
+
+	def seekable(self):
+		return True
+
+	def tell(self):
+		return self.pos
+
+	def seek(self, pos, whence = io.SEEK_SET):
+		if whence == io.SEEK_CUR:
+			pos += self.pos
+		elif whence == io.SEEK_END:
+			pos += self.index.size
+		if pos < 0:
+			raise ValueError('Negative seek position %i' % pos)
+		self.pos = pos
+		return self.pos
+
+	def readinto(self, buf):
+		if self.pos >= self.index.size:
+			return 0
+		block_num = self.index.get_block_num(self.pos)
+		data = self.get_block(block_num)
+		start = self.pos - self.index.blocks[block_num].offset
+		num_bytes = min(len(buf), len(data) - start)
+		buf[0:num_bytes] = data[start:start + num_bytes]
+		self.pos += num_bytes
+		return num_bytes
+
+	def get_block(self, block_num):
+		if block_num in self.cache:
+			return self.cache[block_num]
+
+		if self.executor is not None and (block_num - 1) in self.cache:
+			block_nums = range(
+				block_num,
+				min(block_num + self.threads, self.index.get_num_blocks()))
+			blocks = self.executor.map(self.decompress_block, block_nums)
+		else:
+			block_nums = [block_num]
+			blocks = [self.decompress_block(block_num)]
+		for (i, data) in zip(block_nums, blocks):
+			self.cache[i] = data
+
+		max_cached = max(CACHE_BLOCKS, 2 * self.threads)
+		while len(self.cache) > max_cached:
+			del(self.cache[next(iter(self.cache))])#oldest first
+		return self.cache[block_num]
+
+	def decompress_block(self, block_num):
+		block = self.index.blocks[block_num]
+		data = os.pread(
+			self.fds[block.file_num],
+			block.end - block.start,
+			block.start)
+		if block.state is None:
+			decompressor = zlib.decompressobj(31)
+		else:
+			decompressor = block.state.copy()
+		block_size = self.index.get_block_size(block_num)
+		return decompressor.decompress(data)[0:block_size]
+
+	def close(self):
+		if not self.closed:
+			for fd in self.fds:
+				os.close(fd)
+			if self.executor is not None:
+				self.executor.shutdown()
+			self.cache = {}
+		super().close()
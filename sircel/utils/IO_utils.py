@@ -2,18 +2,24 @@
 Akshay Tambe
 Pachter and Doudna groups
 """
+import os
 import sys
+import json
 import tempfile
 import numpy as np
-import gzip as gz
 import io
+import mmap
 import pickle
 from collections import deque
 from itertools import islice
-import redis
+
+from sircel.utils import Gzip_utils, Merge_utils
 
 np.random.seed(0)
 
+RECORD_INDEX_VERSION = 2
+	#changes whenever build_record_index does
+
 def get_kmers(sequence, k):
 	"""
 	Args:
@@ -31,7 +37,7 @@ def get_cyclic_kmers(read, k, start, end, indel=True):
 	"""
 	Args
 		read (list)
-			a fastq entry as a list of lines
+			a fastq entry as a list of lines (str or bytes)
 		k (int)
 			size of kmer
 		start (int)
@@ -39,18 +45,23 @@ def get_cyclic_kmers(read, k, start, end, indel=True):
 		end (int)
 			end site of barcode within read
 	Returns list
-			list of tuples (string kmer, string qual)
+			list of tuples (kmer, qual), of the same type as the read lines
 			the input read is circularized
 	"""	
+	if isinstance(read[1], bytes):
+		sentinel = b'$'
+		alphabet = [b'A', b'C', b'G', b'T']
+	else:
+		sentinel = '$'
+		alphabet = ['A', 'C', 'G', 'T']
 	seq = read[1]
-	seq = seq[:start] + '$' + seq[start:]
+	seq = seq[:start] + sentinel + seq[start:]
 	qual = read[3]
-	qual = qual[:start] + '$' + qual[start:]
+	qual = qual[:start] + sentinel + qual[start:]
 	
-	alphabet=['A', 'C', 'G', 'T']
 	if(end >= len(seq)):#this doesn't typically happen for drop seq
 		end = len(seq)
-		seq += np.random.choice(alphabet)#add something random for insertions 
+		seq += alphabet[np.random.randint(len(alphabet))]#add something random for insertions 
 	
 	#cyclicized, correct length
 	cyclic =				lambda s: s[start:end] + s[start:start + k - 1]
@@ -70,54 +81,295 @@ def get_cyclic_kmers(read, k, start, end, indel=True):
 	ret = [tup for tup in zip(kmers, quals)]
 	return ret
 
-def unzip(gzipped_lst):
+def open_fastq(fnames, threads = 1, umi_fnames = None):
 	"""
 	Args
-		gzipped (string)
+		fnames (string or list)
+			a fastq file name, a comma separated list of file names, or a list
+			gzipped files are read in place (see Gzip_utils)
+		threads (int)
+			number of threads used to decompress sequential reads
+		umi_fnames (string or list)
+			10x genomics UMI fastq file(s). If given, the records of fnames
+			(cell barcodes) and umi_fnames are merged on the fly (see 
+			Merge_utils)
 	Returns
-		temp file path (string), offsets (list), nuc_content (counter)
+		a seekable binary file object over the concatenated, decompressed files
 	"""
-	out_file = tempfile.NamedTemporaryFile(delete=False)
-	#offsets = []
-	#offset = 0
-	for gzipped in gzipped_lst:
-		if not gzipped.endswith('.gz'):
-			raise TypeError('File does not appear to be gzipped: %s' % gzipped)
-		with gz.open(gzipped) as in_file:
-			for lines in grouper(in_file, 4):
-				lines = b''.join(lines)
-				out_file.write(lines)
-	return out_file.name
+	if isinstance(fnames, str):
+		fnames = fnames.split(',')
+	if umi_fnames is not None:
+		if isinstance(umi_fnames, str):
+			umi_fnames = umi_fnames.split(',')
+		merge_index = Merge_utils.get_index(fnames, umi_fnames)
+		return io.BufferedReader(
+			Merge_utils.MergedReader(merge_index, threads),
+			buffer_size = Gzip_utils.READ_SIZE)
+	if len(fnames) == 1 and not fnames[0].endswith('.gz'):
+		return open(fnames[0], 'rb')
+	gzip_index = Gzip_utils.get_index(fnames)
+	return io.BufferedReader(
+		Gzip_utils.GzipReader(gzip_index, threads),
+		buffer_size = Gzip_utils.READ_SIZE)
 
-def get_read_chunks(barcodes_file, random = False, BUFFER_SIZE = 10000):	
-	if random:
-		barcodes_iter = read_fastq_random(barcodes_file)
+def index_fastq(fnames, index_fname, umi_fnames = None, threads = 1):
+	"""
+	Args
+		fnames (string or list): fastq file name(s), as for open_fastq
+		index_fname (string): .npy file for the record index
+		umi_fnames (string or list): 10x genomics UMI file(s), as for 
+			open_fastq. The record index is then that of the merged records
+		threads (int): number of threads used to decompress inputs whose
+			block index is already built
+	Returns
+		index_fname
+	
+	Builds the block index for gzipped inputs, so that every later
+		open_fastq (including those in forked worker processes) can use it,
+		and the record offset index (see build_record_index). When both
+		are built, records are indexed from the data decompressed for the
+		block index, so that the input is only decompressed once
+	A record index is reused if the fingerprint of its inputs (see
+		get_fastq_fingerprint), saved next to it as .json, still matches
+	"""
+	if isinstance(fnames, str):
+		fnames = fnames.split(',')
+	is_gzipped = len(fnames) > 1 or fnames[0].endswith('.gz')
+	if umi_fnames is not None:
+		if isinstance(umi_fnames, str):
+			umi_fnames = umi_fnames.split(',')
+		if is_gzipped:
+			_ = Gzip_utils.get_index(fnames)
+		if len(umi_fnames) > 1 or umi_fnames[0].endswith('.gz'):
+			_ = Gzip_utils.get_index(umi_fnames)
+		#the merge index holds the merged record starts
+		np.save(index_fname, 
+			Merge_utils.get_index(fnames, umi_fnames, threads).starts)
+		return index_fname
+	
+	fingerprint = get_fastq_fingerprint(fnames)
+	fingerprint_fname = '%s.json' % os.path.splitext(index_fname)[0]
+	if os.path.exists(index_fname) and os.path.exists(fingerprint_fname):
+		with open(fingerprint_fname) as reader:
+			if json.load(reader) == fingerprint:
+				if is_gzipped:
+					_ = Gzip_utils.get_index(fnames)
+				return index_fname
+		os.remove(fingerprint_fname)
+	if is_gzipped and not Gzip_utils.is_indexed(fnames):
+		builder = RecordIndexBuilder()
+		_ = Gzip_utils.get_index(fnames, consumer = builder.add)
+		record_index = builder.get_record_starts()
 	else:
-		barcodes_iter = read_fastq_sequential(barcodes_file)
-	data_buffer = []
+		with open_fastq(fnames, threads) as fq:
+			record_index = build_record_index(fq)
+	np.save(index_fname, record_index)
+	#written last, marks the index as complete
+	with open(fingerprint_fname, 'w') as writer:
+		writer.write(json.dumps(fingerprint, indent = 3))
+	return index_fname
+
+def get_fastq_fingerprint(fnames):
+	"""
+	Returns dict
+		the input files, by absolute path, size and modification time, and 
+		the record index version
+	"""
+	return {
+		'inputs' : [[os.path.abspath(fname), 
+			os.path.getsize(fname), 
+			os.path.getmtime(fname)] for fname in fnames],
+		'version' : RECORD_INDEX_VERSION}
+
+def build_record_index(fq):
+	"""
+	Args
+		fq (file object): opened in binary mode
+	Returns np.array (uint64)
+		byte offset of the start of every fastq record, in file order
+	
+	Newlines are found in bulk, a buffer at a time (see RecordIndexBuilder)
+	"""
+	INDEX_BUFFER_SIZE = 2**24
+	
+	fq.seek(0)
+	builder = RecordIndexBuilder()
 	while True:
-		next_read = next(barcodes_iter)
+		data = fq.read(INDEX_BUFFER_SIZE)
+		if not data:
+			break
+		builder.add(data)
+	return builder.get_record_starts()
+
+class RecordIndexBuilder:
+	"""
+	Builds the record index of a fastq stream that is passed in buffers, 
+	in order (see build_record_index). Every fourth line starts a new 
+	record
+	"""
+	def __init__(self):
+		self.record_starts = [np.zeros(1, dtype = np.uint64)]
+		self.offset = 0
+		self.num_lines = 0
+		self.content_end = 0
+
+	def add(self, data):
+		if len(data.rstrip()) > 0:
+			self.content_end = self.offset + len(data.rstrip())
+		line_ends = np.flatnonzero(
+			np.frombuffer(data, dtype = np.uint8) == ord('\n'))
+		first = (3 - self.num_lines) % 4
+			#first newline in this buffer that ends a record
+		self.record_starts.append(
+			(line_ends[first::4] + self.offset + 1).astype(np.uint64))
+		self.num_lines += len(line_ends)
+		self.offset += len(data)
+
+	def get_record_starts(self):
+		"""
+		Returns np.array (uint64)
+			byte offset of the start of every fastq record
+		"""
+		record_starts = np.concatenate(self.record_starts)
+		#the last newline ends the file, not a record, and so do trailing
+		#blank lines (as for the parsers, see check_fastq_tail)
+		return record_starts[record_starts < np.uint64(self.content_end)]
+
+def load_record_index(index_fname):
+	"""
+	Returns the record offset index as a read-only memory map
+	"""
+	return np.load(index_fname, mmap_mode = 'r')
+
+def get_read_chunks(
+	barcodes_file,
+	random = False,
+	BUFFER_SIZE = 10000,
+	record_index = None,
+	parser = 'mmap',
+	decode = True,
+	shard = None):
+	"""
+	Args
+		barcodes_file (file object)
+		random (bool): sample reads at random, without replacement
+		BUFFER_SIZE (int): number of reads per chunk
+		record_index (np.array): record start offsets (see build_record_index)
+			built from barcodes_file if random reads are needed and it is 
+			not given
+		parser (str): backend for sequential reads
+			'mmap' (read_fastq_mmap) or 'lines' (read_fastq_sequential)
+		decode (bool): return lines as str rather than bytes
+		shard (tuple): (first_record, last_record) to read only that range
+			of records sequentially (see get_shards). Needs record_index
+	Yields
+		lists of (lines, offset) tuples
+	"""
+	if shard is not None:
+		barcodes_iter = read_fastq_shard(
+			barcodes_file, record_index, shard[0], shard[1], decode)
+	elif random:
+		barcodes_iter = read_fastq_random_chunks(
+			barcodes_file, BUFFER_SIZE, record_index, decode)
+	elif parser == 'mmap':
+		barcodes_iter = read_fastq_mmap(barcodes_file, decode)
+	else:
+		barcodes_iter = read_fastq_sequential(barcodes_file, decode)
+	data_buffer = []
+	for next_read in barcodes_iter:
 		data_buffer.append(next_read)
 		
 		if len(data_buffer) == BUFFER_SIZE:
 			yield data_buffer
 			data_buffer = []
+	if len(data_buffer) > 0:
+		yield data_buffer
+
+def read_fastq_random_chunks(fq, BUFFER_SIZE, record_index = None, decode = True):
+	"""
+	Random reads, drawn BUFFER_SIZE records at a time without replacement
+		(see get_random_records). Every record is drawn once, so this ends
+		after the last record. Records within a chunk are visited in file 
+		order, so that each compressed block is decompressed at most once 
+		per chunk
+	"""
+	if record_index is None:
+		record_index = build_record_index(fq)
+	for records in get_random_records(len(record_index), BUFFER_SIZE):
+		offsets = record_index[records[::-1]].tolist()
+		for read in read_fastq_random(fq, offsets = offsets, decode = decode):
+			yield read
 
-def read_fastq_random(fq, offsets = None):
-	file_size = fq.seek(0, io.SEEK_END)
+def get_random_records(num_records, BUFFER_SIZE, BLOCK_SIZE = 64):
+	"""
+	Args
+		num_records (int)
+		BUFFER_SIZE (int): number of records per yielded array
+		BLOCK_SIZE (int): records are drawn in blocks of this many 
+			consecutive record numbers
+	Yields
+		sorted arrays of about BUFFER_SIZE record numbers. Blocks are drawn
+		without replacement and with equal probability, so every record is
+		drawn once, whatever its length. The last array may be shorter
+	
+	Blocks are drawn by a Fisher-Yates shuffle of range(num_blocks) that
+		only stores the positions it has swapped, so memory and time are 
+		proportional to the number of records drawn, not to num_records
+	"""
+	dtype = np.uint32 if num_records < 2**32 else np.uint64
+	num_blocks = (num_records + BLOCK_SIZE - 1) // BLOCK_SIZE
+	blocks_per_chunk = max(1, BUFFER_SIZE // BLOCK_SIZE)
+	swapped = {}
+	for start in range(0, num_blocks, blocks_per_chunk):
+		blocks = []
+		for i in range(start, min(start + blocks_per_chunk, num_blocks)):
+			j = np.random.randint(i, num_blocks)
+			blocks.append(swapped.get(j, j))
+			swapped[j] = swapped.get(i, i)
+			swapped.pop(i, None)
+		blocks = np.sort(np.array(blocks, dtype = dtype))
+		records = (blocks[:, None] * BLOCK_SIZE + \
+			np.arange(BLOCK_SIZE, dtype = dtype)).ravel()
+		yield records[records < num_records]
+
+def read_fastq_random(fq, offsets = None, resync = False, decode = True):
+	"""
+	Args
+		fq (file object)
+		offsets (list): byte offsets, consumed from the end of the list
+			if None, reads are drawn from random byte positions
+		resync (bool): whether offsets can fall inside a record
+			if so, the next complete record is returned. Otherwise offsets
+			must be record starts and records are read without validation
+		decode (bool): return lines as str rather than bytes
+	Yields
+		(lines, offset) for each record, where offset is the record start
+	"""
+	if offsets is None:
+		file_size = fq.seek(0, io.SEEK_END)
+		resync = True
 	while True:
-		if offsets == None:
+		if offsets is None:
 			pos = np.random.randint(file_size)
 		else:
 			try:
 				pos = offsets.pop()
 			except IndexError:
-				raise StopIteration			
-		try:
-			lines = get_next_complete_read(fq, pos)
-			yield (bytes_to_str(lines), pos)
-		except StopIteration:
-			pass
+				return
+		if resync:
+			try:
+				lines, pos = get_next_complete_read(fq, pos)
+			except EOFError:
+				continue
+		else:
+			fq.seek(pos)
+			lines = list(islice(fq, 4))
+		yield (strip_lines(lines, decode), pos)
+
+def strip_lines(lines, decode = True):
+	if decode:
+		return bytes_to_str(lines)
+	return [line.strip() for line in lines]
 
 def bytes_to_str(tup):
 	try:
@@ -126,15 +378,19 @@ def bytes_to_str(tup):
 		return [i.strip() for i in tup]#convert to list otherwise
 							 
 def get_next_complete_read(fq, pos):
+	"""
+	Returns the lines of the first complete fastq entry at or after pos,
+		and the offset where that entry starts
+	"""
 	fq.seek(pos)
 	lines = deque(islice(fq, 4))
 	while not is_valid_fq_entry(lines):
 		try:
-			_ = lines.popleft()
-		except IndexError:
-			raise StopIteration
-		lines.append(next(fq))
-	return lines
+			pos += len(lines.popleft())
+			lines.append(next(fq))
+		except (IndexError, StopIteration):
+			raise EOFError('No complete fastq entry after offset %i' % pos)
+	return lines, pos
 	
 def is_valid_fq_entry(lines):
 	"""
@@ -144,6 +400,8 @@ def is_valid_fq_entry(lines):
 		line 3: '+' or '-'
 		line 4: phred score, same len as seq
 	"""
+	if len(lines) < 4:
+		return False
 	get_first_char = lambda lines: lines[0].decode('utf-8')[0]
 	try:
 		get_first_char(lines)
@@ -159,69 +417,201 @@ def is_valid_fq_entry(lines):
 		return False
 	return True
 	
-def read_fastq_sequential(fq):
+def read_fastq_sequential(fq, decode = True):
 	stop_condition = False
 	offset = 0
 	for lines in grouper(fq, 4):
-		yield (bytes_to_str(lines), offset)
+		yield (strip_lines(lines, decode), offset)
 		offset += sum([len(i) for i in lines])
 
-def merge_barcodefiles_10x(cells_bc_gz, umis_gz):
-	""""
-	10x genomics to dropseq conversion
-
-	3 fastq.gz files from each file
-		I1: read index, UMI
-		R1: cell barcode(?)
-		R2: RNAseq read
-
-	I1- contains cell barcodes
-	@ST-K00126:307:HFM3NBBXX:1:1101:3772:1244 1:N:0:NTCGCCCT
-	NTCGCCCT
-	+
-	#AAAFJ-J
-
-	R1- contains umis
-	@ST-K00126:307:HFM3NBBXX:1:1101:3772:1244 1:N:0:NTCGCCCT
-	NCATTTGAGTAACCCTGATGTCATAA
-	+
-	#AAFFJJJJJJJJJJJJJJJFJJJJJ
-
-	R2- contains RNAseq data
-	@ST-K00126:307:HFM3NBBXX:1:1101:3772:1244 2:N:0:NTCGCCCT
-	NAAGCCAGTTGTGAATCATGCACATCAGCTCCTTCTGAAATGTGTTTATGGCCTAG
-	+
-	#<<A<FJJJFJFJJJJJJJJJFJFJJJJJJJJJJJJJJJFJJFFJJJJJAFJJFJF
-	"""
-	cells_bc_file = unzip(cells_bc_gz)
-	cells_bc_iter = read_fastq_sequential(cells_bc_file)
-	umis_file = unzip(umis_gz)
-	umis_iter = read_fastq_sequential(umis_file)
-	get_prefix = lambda r: r[0].split(' ')[0]
-
-	out_file = tempfile.NamedTemporaryFile(delete = False)
-	out_file.seek(0)#not sure doing this explicitly is required
-	writer = open(out_file.name, 'wb')
-	while(True):
-		try:
-			bc, _ = next(cells_bc_iter)
-			umi, _ = next(umis_iter)
-		except StopIteration:
-			break
-		assert(get_prefix(umi) == get_prefix(bc)), \
-			'Reads are not in order\n%s\n%s' % \
-			('\n'.join(umis), '\n'.join(cells))	
-					
-		combined_seq =  bc[1] + umi[1]
-		combined_phred = bc[3] + umi[3]		
-		output = [	bc[0],
-						combined_seq,
-						bc[2],
-						combined_phred]
-		output_str = ('\n'.join(output) + '\n')
-		writer.write(output_str.encode('utf-8'))
-	writer.close()
-	return out_file.name
+def read_fastq_mmap(fq, decode = True, BUFFER_BYTES = 2**24):
+	"""
+	Args
+		fq (file object): opened in binary mode
+		decode (bool): return lines as str (as read_fastq_sequential does)
+			rather than bytes
+		BUFFER_BYTES (int): size of the window parsed at a time
+	Yields
+		(lines, offset) tuples, like read_fastq_sequential
+	
+	Uncompressed files are memory mapped; other streams (e.g. gzipped
+	files) are read a buffer at a time. Record boundaries are found for a
+	whole window at once (see get_fastq_records), and the window is split
+	into lines with a single bytes.split
+	"""
+	try:
+		buf = mmap.mmap(fq.fileno(), 0, access = mmap.ACCESS_READ)
+	except (io.UnsupportedOperation, OSError, ValueError):
+		buf = None#not a regular file, or an empty one
+	
+	if buf is not None:
+		start = 0
+		while start < len(buf):
+			end = min(start + BUFFER_BYTES, len(buf))
+			record_starts, next_start = get_fastq_records(
+				buf, start, end, end == len(buf))
+			for read in split_fastq_records(
+				buf, record_starts, next_start, 0, decode):
+				yield read
+			if next_start == start:
+				if end == len(buf):#no complete record left
+					check_fastq_tail(buf[start:])
+					break
+				BUFFER_BYTES *= 2#a single record longer than the window
+			start = next_start
+		buf.close()
+		return
+	
+	for read in read_fastq_range(fq, 0, None, decode, BUFFER_BYTES):
+		yield read
+
+def read_fastq_range(fq, start, end, decode = True, BUFFER_BYTES = 2**24):
+	"""
+	Args
+		fq (file object): opened in binary mode
+		start (int): byte offset of the first record
+		end (int): byte offset after the last record, or None for the end
+			of the file
+		decode (bool): return lines as str rather than bytes
+		BUFFER_BYTES (int): size of the window parsed at a time
+	Yields
+		(lines, offset) tuples for the records in [start, end)
+	"""
+	fq.seek(start)
+	buf = b''
+	buf_offset = start
+	at_eof = False
+	while not at_eof:
+		read_size = BUFFER_BYTES
+		if end is not None:
+			read_size = min(read_size, end - buf_offset - len(buf))
+		data = fq.read(read_size) if read_size > 0 else b''
+		at_eof = len(data) == 0
+		buf += data
+		record_starts, next_start = get_fastq_records(
+			buf, 0, len(buf), at_eof)
+		for read in split_fastq_records(
+			buf, record_starts, next_start, buf_offset, decode):
+			yield read
+		buf = buf[next_start:]
+		buf_offset += next_start
+	check_fastq_tail(buf)
+
+def check_fastq_tail(tail):
+	"""
+	Checks that what follows the last complete record of a file is only
+	whitespace (e.g. a trailing blank line), not a truncated record
+	"""
+	assert len(bytes(tail).strip()) == 0, \
+		'Incomplete fastq record at end of file'
+
+def get_shards(record_index, num_shards):
+	"""
+	Args
+		record_index (np.array): record start offsets (see build_record_index)
+		num_shards (int)
+	Returns list
+		(first_record, last_record) for at most num_shards contiguous, 
+		nearly equal ranges of record numbers. Paired files (reads and 
+		barcodes) have the same records, so the same ranges apply to both
+	"""
+	num_records = len(record_index)
+	bounds = np.linspace(0, num_records, num_shards + 1).astype(np.int64)
+	return [(int(first), int(last)) for (first, last) in \
+		zip(bounds[0:-1], bounds[1:]) if last > first]
+
+def read_fastq_shard(fq, record_index, first_record, last_record, decode = True):
+	"""
+	Yields
+		(lines, offset) tuples for records first_record ... last_record - 1
+		The byte range of the shard is looked up in record_index, and 
+		parsed as for read_fastq_mmap
+	"""
+	start = int(record_index[first_record])
+	end = None
+	if last_record < len(record_index):
+		end = int(record_index[last_record])
+	return read_fastq_range(fq, start, end, decode)
+
+def get_fastq_records(buf, start, end, at_eof):
+	"""
+	Args
+		buf (bytes-like): buffer that holds complete records from start on
+		start, end (int): window of buf to parse
+		at_eof (bool): if end is the end of the file
+			a final line without a newline is accepted
+	Returns
+		record_starts (np.array): position in buf of each complete record
+			in the window
+		next_start (int): position in buf after the last complete record
+	"""
+	window = np.frombuffer(buf, dtype = np.uint8, count = end - start, offset = start)
+	line_ends = np.flatnonzero(window == ord('\n')) + start
+	if at_eof and end > start and \
+		(len(line_ends) == 0 or line_ends[-1] != end - 1):
+		line_ends = np.append(line_ends, end)
+	num_records = len(line_ends) // 4
+	if num_records == 0:
+		return np.zeros(0, dtype = np.int64), start
+	
+	record_ends = line_ends[3:4 * num_records:4]
+	record_starts = np.empty_like(record_ends)
+	record_starts[0] = start
+	record_starts[1:] = record_ends[0:-1] + 1
+	return record_starts, int(record_ends[-1]) + 1
+
+def split_fastq_records(buf, record_starts, next_start, buf_offset, decode):
+	"""
+	Yields (lines, offset) for each record found by get_fastq_records
+		Lines do not include the trailing newline / carriage return
+	"""
+	if len(record_starts) == 0:
+		return
+	text = buf[int(record_starts[0]):next_start]
+	(newline, carriage_return) = (b'\n', b'\r')
+	if decode:
+		text = text.decode('utf-8')
+		(newline, carriage_return) = ('\n', '\r')
+	lines = text.split(newline)
+	if carriage_return in text:
+		lines = [line.rstrip() for line in lines]
+	lines_iter = iter(lines)
+	offsets = (record_starts + buf_offset).tolist()
+	for (offset, l0, l1, l2, l3) in zip(
+		offsets, lines_iter, lines_iter, lines_iter, lines_iter):
+		yield ([l0, l1, l2, l3], offset)
+
+def split_list(lst, num_parts):
+	"""
+	Splits lst into at most num_parts contiguous, nearly equal parts
+	"""
+	part_size = max(1, -(-len(lst) // num_parts))
+	return [lst[i:i + part_size] for i in range(0, len(lst), part_size)]
+
+def get_cost_chunks(costs, num_chunks):
+	"""
+	Args
+		costs (np.array): estimated cost of each item
+		num_chunks (int): target number of chunks
+	Returns list
+		np.arrays of item numbers. Items are taken by decreasing cost (ties
+		in list order), and each chunk ends once the running cost passes
+		the next multiple of sum(costs) / num_chunks. Costly items come 
+		first, in small chunks, and the cheap tail in larger ones, so that
+		workers that pull chunks as they go finish at about the same time
+	"""
+	costs = np.maximum(np.asarray(costs, dtype = np.float64), 1)
+	if len(costs) == 0:
+		return []
+	order = np.argsort(-costs, kind = 'stable')
+	running_cost = np.cumsum(costs[order])
+	targets = np.arange(1, num_chunks) * (running_cost[-1] / num_chunks)
+	bounds = np.unique(np.concatenate((
+		[0],
+		np.searchsorted(running_cost, targets) + 1,
+		[len(costs)])))
+	bounds = bounds[bounds <= len(costs)]
+	return [order[first:last] for (first, last) in zip(bounds[0:-1], bounds[1:])]
 
 def grouper(iterable, n, fillvalue=None):
     "Collect data into fixed-length chunks or blocks"
@@ -315,31 +705,6 @@ def read_from_pickle(fnames_lst, key):
 			values = values + chunk[key]
 	return values
 	
-def initialize_redis_pipeline(db=0):
-	redis_db = redis.StrictRedis(host="localhost", port=6379, db=db)#redis
-	
-	redis_db.flushall()
-	redis_pipe = redis_db.pipeline()
-	return redis_db, redis_pipe
-
-def get_from_db(kmer_idx_pipe, keys):
-	for key in keys:
-		if isinstance(key, str):
-			key = key.encode('utf-8')
-		kmer_idx_pipe.lrange(key, 0, -1)
-	pipe_out = kmer_idx_pipe.execute()	
-	entries = []
-	
-	decode = lambda mystr: [int(i) for i in mystr.decode('utf-8').split(',')]
-	
-	for entry in pipe_out:
-		if(entry != None):
-			for e in entry:
-				offset1, offset2 = decode(e)
-				entries += [offset1, offset2]
-				
-	return entries
-	
 	
 	
 	
@@ -0,0 +1,761 @@
+"""
+Akshay Tambe
+Pachter and Doudna groups
+
+Kmer_utils.py
+Integer codes for kmers over the alphabet ACGT$
+	Each symbol takes 3 bits (A, C, G, T, $ are 0-4; N and anything else
+	is 5). The first symbol is stored in the highest bits, so codes sort
+	in the same order as kmer strings with A < C < G < T < $
+	A kmer of up to 10 symbols fits in a uint32 (dropseq, k = 8) and of
+	up to 21 symbols in a uint64 (10x genomics, k = 20)
+
+	In a de Bruijn graph with kmers as edges, the node (first k-1 symbols)
+	of a kmer code is code >> BITS, and the neighbor (last k-1 symbols)
+	is code & get_mask(k - 1)
+	Likewise, the kmer of size k - 1 that starts at the same position is
+	code >> BITS. The cyclic kmers of every size can be had from those of
+	the largest size by shifting (see get_shorter_kmer_codes)
+"""
+import os
+import math
+import operator
+import numpy as np
+
+BITS = 3
+ALPHABET = 'ACGT$N'
+SENTINEL = ALPHABET.index('$')
+OTHER = ALPHABET.index('N')
+MAX_K = 64 // BITS
+
+TRANSLATE = bytearray([OTHER] * 256)
+for (code, symbol) in enumerate(ALPHABET):
+	TRANSLATE[ord(symbol)] = code
+TRANSLATE = bytes(TRANSLATE)
+	#bytes.translate table from ascii to symbol codes
+
+KMER_INDEX_ARRAYS = ['codes', 'counts', 'ranks', 'indptr', 'postings']
+KMER_INDEX_VERSION = 3
+	#changes whenever the saved layout or the read sampling does
+_kmer_indices = {}
+
+def get_dtype(k):
+	"""
+	Returns the smallest unsigned numpy integer type that holds kmer codes
+	"""
+	assert k <= MAX_K, \
+		'Kmer size %i is too large for integer kmer codes (max %i)' % (k, MAX_K)
+	if BITS * k <= 32:
+		return np.uint32
+	return np.uint64
+
+def get_mask(k):
+	return (1 << (BITS * k)) - 1
+
+def to_symbols(seq):
+	"""
+	Args
+		seq (str or bytes): nucleotide sequence
+	Returns bytes
+		one symbol code (0-5) per position
+	"""
+	if isinstance(seq, str):
+		seq = seq.encode('utf-8')
+	return seq.translate(TRANSLATE)
+
+def encode_kmer(kmer):
+	"""
+	Args
+		kmer (str or bytes)
+	Returns int
+	"""
+	code = 0
+	for symbol in to_symbols(kmer):
+		code = (code << BITS) | symbol
+	return code
+
+def decode_kmer(code, k):
+	"""
+	Args
+		code (int): kmer code
+		k (int): kmer size
+	Returns str
+	"""
+	code = int(code)
+	kmer = []
+	for i in range(k):
+		kmer.append(ALPHABET[code & 7])
+		code >>= BITS
+	return ''.join(reversed(kmer))
+
+def is_sentinel_kmer(code, k):
+	"""
+	Returns true if the kmer starts with '$'
+	"""
+	return (int(code) >> (BITS * (k - 1))) == SENTINEL
+
+def get_substitution_codes(code, k):
+	"""
+	Returns list
+		codes of the kmers one substitution away from code. Only 
+		nucleotides (ACGT) are substituted, by other nucleotides
+	"""
+	codes = []
+	for i in range(k):
+		shift = BITS * i
+		symbol = (code >> shift) & get_mask(1)
+		if symbol < SENTINEL:
+			cleared = code & ~(get_mask(1) << shift)
+			codes += [cleared | (other << shift) \
+				for other in range(SENTINEL) if other != symbol]
+	return codes
+
+def get_kmer_codes(symbols, k):
+	"""
+	Args
+		symbols (bytes): symbol codes (see to_symbols)
+		k (int)
+	Returns list
+		codes of all kmers of symbols, in order (as IO_utils.get_kmers)
+	"""
+	mask = get_mask(k)
+	codes = []
+	code = 0
+	for (i, symbol) in enumerate(symbols):
+		code = ((code << BITS) | symbol) & mask
+		if i >= k - 1:
+			codes.append(code)
+	return codes
+
+def get_cyclic_kmer_codes(read, k, start, end, indel = True):
+	"""
+	Args
+		read (list)
+			a fastq entry as a list of lines (str or bytes)
+		k (int)
+			size of kmer
+		start (int)
+			start site of barcode within read
+		end (int)
+			end site of barcode within read
+	Returns list
+		codes for the kmers of IO_utils.get_cyclic_kmers, in the same order
+		Quality kmers are not computed, so when a random base is appended
+		the extended variant keeps its last kmer
+	"""
+	seq = to_symbols(read[1])
+	seq = seq[:start] + bytes([SENTINEL]) + seq[start:]
+	if(end >= len(seq)):#this doesn't typically happen for drop seq
+		end = len(seq)
+		seq += bytes([np.random.randint(4)])#add something random for insertions
+
+	prefix = seq[start:start + k - 1]
+	codes = get_kmer_codes(seq[start:end] + prefix, k)
+	if(indel == True):
+		codes += get_kmer_codes(seq[start:end - 1] + prefix, k) + \
+			get_kmer_codes(seq[start:end + 1] + prefix, k)
+	return codes
+
+SYMBOLS = np.frombuffer(TRANSLATE, dtype = np.uint8)
+	#numpy lookup table from ascii to symbol codes
+PAD = 0xff
+	#placeholder for positions past the end of a read
+
+def get_barcode_array(reads, start, end):
+	"""
+	Args
+		reads (list): fastq entries as lists of lines (str or bytes)
+		start, end (int): barcode coordinates within the read sequence
+	Returns np.array (uint8)
+		shape (len(reads), end - start), symbol codes of the barcode of 
+		each read. Positions past the end of a read are filled with random
+		nucleotides, as get_cyclic_kmer_codes does for a missing last base
+	"""
+	width = end - start
+	if len(reads) > 0 and isinstance(reads[0][1], str):
+		joined = ''.join(
+			[read[1][start:end].ljust(width, chr(PAD)) for read in reads])
+		joined = joined.encode('latin-1')
+	else:
+		joined = b''.join(
+			[read[1][start:end].ljust(width, bytes([PAD])) for read in reads])
+	raw = np.frombuffer(joined, dtype = np.uint8).reshape(len(reads), width)
+	barcodes = SYMBOLS[raw]
+	padded = raw == PAD
+	if padded.any():
+		barcodes[padded] = np.random.randint(4, size = padded.sum())
+	return barcodes
+
+def get_cyclic_kmer_codes_batch(barcodes, k, indel = True):
+	"""
+	Args
+		barcodes (np.array): shape (num_reads, barcode_length) symbol codes
+			(see get_barcode_array)
+		k (int): size of kmer
+		indel (bool): include truncated and extended cycles
+	Returns
+		codes (np.array): kmer codes of every read, for the exact, truncated
+			and extended cycles, read by read in the order of 
+			get_cyclic_kmer_codes
+		rows (np.array): row of barcodes for each code
+	
+	The cycles of every read are built at once by column slicing, and the
+	codes of each cycle by shifting and or-ing k column windows
+	Codes of kmers longer than MAX_K (the whole 10x genomics barcode) do 
+	not fit in 64 bits, see get_wide_cyclic_kmer_codes
+	"""
+	if k > MAX_K:
+		return get_wide_cyclic_kmer_codes(barcodes, k, indel)
+	(num_reads, length) = barcodes.shape
+	cycle = np.empty((num_reads, length + 1), dtype = np.uint64)
+	cycle[:, 0] = SENTINEL
+	cycle[:, 1:] = barcodes
+		#'$' + barcode. exact cycles have length barcode_length
+	prefix = cycle[:, 0:k - 1]
+	
+	cycle_lengths = [length]
+	if indel:
+		cycle_lengths += [length - 1, length + 1]
+	variants = []
+	for cycle_length in cycle_lengths:
+		circular = np.hstack([cycle[:, 0:cycle_length], prefix])
+		num_kmers = circular.shape[1] - k + 1
+		if num_kmers <= 0:
+			continue
+		codes = np.zeros((num_reads, num_kmers), dtype = np.uint64)
+		for i in range(k):
+			codes <<= np.uint64(BITS)
+			codes |= circular[:, i:i + num_kmers]
+		variants.append(codes)
+	
+	codes = np.hstack(variants).astype(get_dtype(k))
+	rows = np.repeat(np.arange(num_reads), codes.shape[1])
+	return codes.ravel(), rows
+
+def get_wide_cyclic_kmer_codes(barcodes, k, indel = True):
+	"""
+	get_cyclic_kmer_codes_batch for kmers longer than MAX_K
+	Returns
+		codes (np.array): python int codes, in an object array
+		rows (np.array)
+	Codes are computed read by read, as get_cyclic_kmer_codes
+	"""
+	codes = []
+	rows = []
+	for (row, barcode) in enumerate(barcodes.tolist()):
+		cycle = [SENTINEL] + barcode
+		prefix = cycle[0:k - 1]
+		cycle_lengths = [len(barcode)]
+		if indel:
+			cycle_lengths += [len(barcode) - 1, len(barcode) + 1]
+		num_codes = len(codes)
+		for cycle_length in cycle_lengths:
+			codes += get_kmer_codes(cycle[0:cycle_length] + prefix, k)
+		rows += [row] * (len(codes) - num_codes)
+	return np.array(codes, dtype = object), np.array(rows, dtype = np.int64)
+
+def get_shorter_kmer_codes(codes, k, shorter_k):
+	"""
+	Args
+		codes (np.array): kmer codes of size k, e.g. from 
+			get_cyclic_kmer_codes_batch
+		shorter_k (int): kmer size, at most k
+	Returns np.array
+		codes of the kmers of size shorter_k at the same positions. For 
+		cyclic kmers these are exactly the cyclic kmers of size shorter_k, 
+		as long as k is at most the cycle length
+	"""
+	shift = BITS * (k - shorter_k)
+	if codes.dtype == object:
+		return codes >> shift
+	return codes >> codes.dtype.type(shift)
+
+def get_tagged_codes(codes, k):
+	"""
+	Args
+		codes (np.array): kmer codes of size k
+	Returns np.array (uint64)
+		codes with a 1 bit set above the highest symbol. Tagged codes of 
+		different kmer sizes never collide, so kmers of all sizes can be 
+		kept in one map
+		Tagged codes that do not fit in 64 bits (k > MAX_K, or codes from
+		get_wide_cyclic_kmer_codes) are python ints, in an object array
+	"""
+	if codes.dtype == object or k > MAX_K:
+		return codes.astype(object) | (1 << (BITS * k))
+	return codes.astype(np.uint64) | np.uint64(1 << (BITS * k))
+
+class KmerIndex:
+	"""
+	Incremental kmer index, built a chunk of reads at a time
+	Attributes
+		codes (np.array): distinct kmer codes seen so far, sorted
+		counts (np.array): number of postings of each code
+		ranks (np.array): order in which each code was first seen
+		post_codes, post_offsets (np.array): postings (kmer code, read
+			offset) in the order they were added. The arrays grow by 
+			doubling; the first num_postings entries are used
+		indptr, postings (np.array): CSR layout of the postings, built by 
+			group_postings. The read offsets of codes[i] are sorted, delta
+			encoded and stored as varints (see encode_varints) in
+			postings[indptr[i]:indptr[i + 1]] (uint8)
+		fname (str): directory the CSR arrays are saved to (see save)
+		sum_counts, sum_squares (int): running sums of counts and squared
+			counts, for the convergence statistic (see add)
+		count_correlation (float): pearson correlation of the counts of 
+			the codes seen before the last add with their counts after it.
+			With a sketch, of their sketch estimates
+		sketch (CountMinSketch): if given, every kmer is counted in the 
+			sketch, and only kmers with an estimated count of at least 
+			min_count are indexed (their earlier postings are not kept)
+		bloom (BloomFilter): if given, a kmer is only indexed once it is 
+			seen a second time. The first sighting goes into the filter
+		corrections (np.array): with a bloom filter, 1 for codes whose first
+			sighting was kept in the filter rather than the index
+		estimates (np.array): estimated count of each code, used to rank 
+			codes when a sketch (sketch estimates) or a bloom filter 
+			(counts + corrections) is given
+	"""
+	def __init__(self, _k, sketch = None, min_count = 1, bloom = None):
+		self.k = _k
+		dtype = get_dtype(_k)
+		self.codes = np.zeros(0, dtype = dtype)
+		self.counts = np.zeros(0, dtype = np.int64)
+		self.ranks = np.zeros(0, dtype = np.int64)
+		self.post_codes = np.zeros(0, dtype = dtype)
+		self.post_offsets = np.zeros(0, dtype = np.int64)
+		self.num_postings = 0
+		self.indptr = None
+		self.postings = None
+		self.fname = None
+		self.sum_counts = 0
+		self.sum_squares = 0
+		self.count_correlation = 0
+		self.sketch = sketch
+		self.min_count = min_count
+		self.bloom = bloom
+		self.corrections = None
+		if bloom is not None:
+			self.corrections = np.zeros(0, dtype = np.int64)
+		self.estimates = None
+	
+	def get_num_kmers(self):
+		return len(self.codes)
+	
+	def add(self, codes, offsets):
+		"""
+		Args
+			codes (np.array): kmer codes
+			offsets (np.array): offset of the read each code came from
+		
+		New codes are merged into the sorted arrays with np.insert (no 
+		re-sort), and the convergence statistic is updated from the codes 
+		of this chunk only. For a chunk of n codes, m of them distinct, and
+		an index of U codes, an add takes O(n log n) for the chunk's 
+		np.unique, O(m log U) to look its codes up, and O(U + m) to merge:
+		every np.insert copies the whole array. The merge is done once per
+		chunk, so for chunks of BUFFER_SIZE reads it is a small part of 
+		each add until U is many times the chunk size
+		"""
+		if self.sketch is not None:
+			(codes, offsets, before, after) = self.filter_by_sketch(
+				codes, offsets)
+		(chunk_codes, first_seen, inverse, chunk_counts) = np.unique(codes, 
+			return_index = True, return_inverse = True, return_counts = True)
+		(pos, is_new) = self.find_codes(chunk_codes)
+		corrected_codes = None
+		if self.bloom is not None:
+			(keep, promoted) = self.filter_by_bloom(
+				chunk_codes, chunk_counts, is_new)
+			corrected_codes = chunk_codes[promoted]
+			(codes, offsets) = (codes[keep[inverse]], offsets[keep[inverse]])
+			(chunk_codes, first_seen, chunk_counts, pos, is_new) = (
+				chunk_codes[keep], first_seen[keep], chunk_counts[keep], 
+				pos[keep], is_new[keep])
+			if self.sketch is not None:
+				(before, after) = (before[keep], after[keep])
+		self.append_postings(codes, offsets)
+		
+		#new codes are ranked after all old ones, by first occurrence
+		new_codes = chunk_codes[is_new]
+		new_ranks = np.empty(len(new_codes), dtype = np.int64)
+		new_ranks[np.argsort(first_seen[is_new], kind = 'stable')] = \
+			np.arange(len(self.codes), len(self.codes) + len(new_codes))
+		
+		if self.sketch is None:
+			self.update_count_correlation(self.counts[pos[~is_new]], 
+				chunk_counts[~is_new], chunk_counts[is_new])
+		else:
+			#codes enter with their estimate, which counts the sightings 
+			#before they reached min_count
+			self.update_count_correlation(before[~is_new], 
+				after[~is_new] - before[~is_new], after[is_new])
+		
+		insert_pos = pos[is_new]
+		self.codes = np.insert(self.codes, insert_pos, new_codes)
+		self.counts = np.insert(self.counts, insert_pos, 0)
+		self.ranks = np.insert(self.ranks, insert_pos, new_ranks)
+		self.counts[np.searchsorted(self.codes, chunk_codes)] += chunk_counts
+		if self.corrections is not None:
+			self.corrections = np.insert(self.corrections, insert_pos, 0)
+			self.corrections[np.searchsorted(self.codes, corrected_codes)] += 1
+		self.indptr = None
+	
+	def find_codes(self, chunk_codes):
+		"""
+		Args
+			chunk_codes (np.array): sorted, distinct codes
+		Returns
+			pos (np.array): position of each code in self.codes (or where 
+				it would be inserted)
+			is_new (np.array): True for codes that are not in self.codes
+		"""
+		pos = np.searchsorted(self.codes, chunk_codes)
+		is_new = np.ones(len(chunk_codes), dtype = bool)
+		in_range = pos < len(self.codes)
+		is_new[in_range] = self.codes[pos[in_range]] != chunk_codes[in_range]
+		return pos, is_new
+	
+	def filter_by_bloom(self, chunk_codes, chunk_counts, is_new):
+		"""
+		Two stage insertion. Codes seen once, for the first time, are only 
+			added to the filter. Codes already indexed, seen before by the 
+			filter, or seen twice in this chunk are indexed
+		Returns
+			keep (np.array): True for chunk codes to index
+			promoted (np.array): True for new codes seen before by the 
+				filter. Their first sighting is not in the postings
+		"""
+		new = np.flatnonzero(is_new)
+		seen = self.bloom.contains(chunk_codes[new])
+		singletons = new[~seen & (chunk_counts[new] == 1)]
+		self.bloom.add(chunk_codes[singletons])
+		keep = np.ones(len(chunk_codes), dtype = bool)
+		keep[singletons] = False
+		promoted = np.zeros(len(chunk_codes), dtype = bool)
+		promoted[new[seen]] = True
+		return keep, promoted
+	
+	def update_count_correlation(self, old_counts, increments, new_counts):
+		"""
+		Args
+			old_counts (np.array): counts, before this chunk, of the old 
+				codes in the chunk
+			increments (np.array): chunk counts of those codes
+			new_counts (np.array): chunk counts of codes not seen before
+		
+		With x the counts of all old codes before the chunk and y after it,
+		pearson r needs n, sum(x), sum(x^2), sum(y), sum(y^2) and sum(xy).
+		Only the codes in the chunk change, so all of these follow from 
+		the running sums. Sums are exact python ints
+		"""
+		n = len(self.codes)
+		c = old_counts.tolist()
+		d = increments.tolist()
+		sum_d = sum(d)
+		sum_cd = sum(map(operator.mul, c, d))
+		sum_dd = sum(map(operator.mul, d, d))
+		
+		(sum_x, sum_xx) = (self.sum_counts, self.sum_squares)
+		sum_y = sum_x + sum_d
+		sum_xy = sum_xx + sum_cd
+		sum_yy = sum_xx + 2 * sum_cd + sum_dd
+		
+		var_x = n * sum_xx - sum_x * sum_x
+		var_y = n * sum_yy - sum_y * sum_y
+		if n <= 1 or var_x <= 0 or var_y <= 0:
+			self.count_correlation = 0
+		else:
+			self.count_correlation = (n * sum_xy - sum_x * sum_y) / \
+				math.sqrt(float(var_x) * float(var_y))
+		
+		new = new_counts.tolist()
+		self.sum_counts = sum_y + sum(new)
+		self.sum_squares = sum_yy + sum(map(operator.mul, new, new))
+	
+	def filter_by_sketch(self, codes, offsets):
+		"""
+		Counts codes in the sketch. Returns the (codes, offsets) postings of
+			codes whose estimated count has reached min_count, and the 
+			estimated counts of those (distinct, sorted) codes before and 
+			after this chunk
+		"""
+		(chunk_codes, inverse, chunk_counts) = np.unique(
+			codes, return_inverse = True, return_counts = True)
+		before = self.sketch.query(chunk_codes)
+		self.sketch.add(chunk_codes, chunk_counts)
+		after = self.sketch.query(chunk_codes)
+		keep = after >= self.min_count
+		return (codes[keep[inverse]], offsets[keep[inverse]], 
+			before[keep], after[keep])
+	
+	def append_postings(self, codes, offsets):
+		num_postings = self.num_postings + len(codes)
+		if num_postings > len(self.post_codes):
+			capacity = max(num_postings, 2 * len(self.post_codes))
+			self.post_codes = np.resize(self.post_codes, capacity)
+			self.post_offsets = np.resize(self.post_offsets, capacity)
+		self.post_codes[self.num_postings:num_postings] = codes
+		self.post_offsets[self.num_postings:num_postings] = offsets
+		self.num_postings = num_postings
+	
+	def get_most_common(self):
+		"""
+		Returns np.array
+			codes by decreasing count (estimated count, see get_estimates).
+			Ties are in the order codes were first seen
+		"""
+		return self.codes[np.lexsort((self.ranks, -self.get_estimates()))]
+	
+	def get_estimates(self):
+		"""
+		Returns np.array
+			count of every code: the sketch estimate with a sketch, the 
+			number of postings plus the first sighting kept in the filter 
+			with a bloom filter, and the number of postings otherwise
+		"""
+		if self.estimates is not None:
+			return self.estimates
+		elif self.sketch is not None:
+			return self.sketch.query(self.codes)
+		elif self.corrections is not None:
+			return self.counts + self.corrections
+		return self.counts
+	
+	def group_postings(self):
+		"""
+		Builds the compressed CSR layout, and frees the posting arrays
+		"""
+		post_offsets = self.post_offsets[0:self.num_postings].astype(np.uint64)
+		order = np.lexsort((post_offsets, self.post_codes[0:self.num_postings]))
+		post_offsets = post_offsets[order]
+		
+		#delta encode within each code. the first offset is kept as is
+		starts = np.zeros(len(self.codes) + 1, dtype = np.int64)
+		np.cumsum(self.counts, out = starts[1:])
+		deltas = np.empty_like(post_offsets)
+		deltas[1:] = post_offsets[1:] - post_offsets[0:-1]
+		deltas[starts[0:-1][self.counts > 0]] = \
+			post_offsets[starts[0:-1][self.counts > 0]]
+		(self.postings, lengths) = encode_varints(deltas)
+		
+		#byte offset of the first posting of each code
+		byte_starts = np.zeros(len(lengths) + 1, dtype = np.int64)
+		np.cumsum(lengths, out = byte_starts[1:])
+		self.indptr = byte_starts[starts]
+		self.post_codes = self.post_codes[0:0]
+		self.post_offsets = self.post_offsets[0:0]
+		self.num_postings = 0
+		if self.sketch is not None:
+			self.estimates = self.sketch.query(self.codes)
+		elif self.corrections is not None:
+			self.estimates = self.counts + self.corrections
+	
+	def save(self, fname):
+		"""
+		Args
+			fname (str): directory for the CSR arrays (one .npy each)
+		Returns
+			fname
+		"""
+		if self.indptr is None:
+			self.group_postings()
+		if not os.path.exists(fname):
+			os.makedirs(fname)
+		for name in KMER_INDEX_ARRAYS:
+			np.save('%s/%s.npy' % (fname, name), getattr(self, name))
+		if self.estimates is not None:
+			np.save('%s/estimates.npy' % fname, self.estimates)
+		self.fname = fname
+		_ = _kmer_indices.pop(fname, None)
+		return fname
+	
+	def get_num_postings(self, codes):
+		"""
+		Returns np.array
+			number of postings (reads, with repeats) of each of codes, 0 for
+			codes that are not indexed
+		"""
+		codes = np.asarray(codes, dtype = self.codes.dtype)
+		if len(self.codes) == 0:
+			return np.zeros(len(codes), dtype = np.int64)
+		i = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+		return np.where(self.codes[i] == codes, self.counts[i], 0)
+	
+	def get_counts(self, codes):
+		"""
+		Returns np.array
+			estimated count of each of codes (see get_estimates), 0 for 
+			codes that are not indexed
+		"""
+		codes = np.asarray(codes, dtype = self.codes.dtype)
+		if len(self.codes) == 0:
+			return np.zeros(len(codes), dtype = np.int64)
+		i = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+		return np.where(self.codes[i] == codes, self.get_estimates()[i], 0)
+	
+	def get_postings(self, code):
+		"""
+		Returns np.array
+			sorted offsets of the reads that contain code (decoded on demand)
+		"""
+		if self.indptr is None:
+			self.group_postings()
+		i = np.searchsorted(self.codes, code)
+		if i >= len(self.codes) or self.codes[i] != code:
+			return np.zeros(0, dtype = np.uint64)
+		return np.cumsum(
+			decode_varints(self.postings[self.indptr[i]:self.indptr[i + 1]]),
+			dtype = np.uint64)
+
+def encode_varints(values):
+	"""
+	Args
+		values (np.array): unsigned integers
+	Returns
+		encoded (np.array): uint8 varints. Each value is stored 7 bits per
+			byte, low bits first; the high bit is set on every byte but the 
+			last of a value
+		lengths (np.array): number of bytes of each value
+	"""
+	values = np.asarray(values, dtype = np.uint64)
+	lengths = np.ones(len(values), dtype = np.int64)
+	for i in range(1, 10):
+		lengths += values >= np.uint64(1 << (7 * i))
+	starts = np.cumsum(lengths) - lengths
+	
+	encoded = np.zeros(int(lengths.sum()), dtype = np.uint8)
+	for i in range(int(lengths.max()) if len(values) > 0 else 0):
+		in_value = lengths > i
+		byte = (values[in_value] >> np.uint64(7 * i)) & np.uint64(0x7f)
+		byte |= (lengths[in_value] > i + 1).astype(np.uint64) << np.uint64(7)
+		encoded[starts[in_value] + i] = byte
+	return encoded, lengths
+
+def decode_varints(encoded):
+	"""
+	Inverse of encode_varints
+	Returns np.array (uint64)
+	"""
+	encoded = np.asarray(encoded, dtype = np.uint8)
+	if len(encoded) == 0:
+		return np.zeros(0, dtype = np.uint64)
+	value_ends = np.flatnonzero(encoded < 0x80)
+	value_starts = np.concatenate(([0], value_ends[0:-1] + 1))
+	shifts = np.arange(len(encoded), dtype = np.int64) - \
+		np.repeat(value_starts, value_ends - value_starts + 1)
+	parts = (encoded & 0x7f).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+	return np.add.reduceat(parts, value_starts)
+
+def load_kmer_index(fname, k):
+	"""
+	Returns the KmerIndex saved to fname, with its arrays memory mapped 
+		read-only. Indices are cached per process, so every worker process
+		maps the same pages once, however many lookups it makes
+	"""
+	if fname not in _kmer_indices:
+		kmer_index = KmerIndex(k)
+		for name in KMER_INDEX_ARRAYS:
+			setattr(kmer_index, name, 
+				np.load('%s/%s.npy' % (fname, name), mmap_mode = 'r'))
+		if os.path.exists('%s/estimates.npy' % fname):
+			kmer_index.estimates = np.load('%s/estimates.npy' % fname)
+		kmer_index.fname = fname
+		_kmer_indices[fname] = kmer_index
+	return _kmer_indices[fname]
+
+def get_hash_multipliers(num_hashes, seed):
+	"""
+	Returns np.array
+		random odd 64 bit multipliers for hash_codes
+	"""
+	random_state = np.random.RandomState(seed)
+	return random_state.randint(
+		0, 2**63, size = num_hashes, dtype = np.int64).astype(np.uint64) * \
+		np.uint64(2) + np.uint64(1)
+
+def hash_codes(codes, multiplier, shift):
+	"""
+	Multiply-shift hash of kmer codes to 64 - shift bits
+	"""
+	return (codes.astype(np.uint64) * multiplier) >> shift
+
+class CountMinSketch:
+	"""
+	Approximate counts of kmer codes in a fixed amount of memory
+	Attributes
+		table (np.array): depth x width counters (uint32)
+		multipliers (np.array): odd 64 bit multipliers, one per row. A code
+			is counted in row i at column (code * multipliers[i]) >> shift
+	Estimates are never below the true count; they exceed it by at most 
+	about e * total / width, with probability 1 - exp(-depth)
+	"""
+	def __init__(self, memory_bytes, depth = 4, seed = 0):
+		"""
+		Args
+			memory_bytes (int): memory budget. The width is the largest 
+				power of two that fits
+			depth (int): number of hash functions (rows)
+		"""
+		width_bits = max(1, int(math.log2(max(2, memory_bytes // (4 * depth)))))
+		self.width = 1 << width_bits
+		self.shift = np.uint64(64 - width_bits)
+		self.table = np.zeros((depth, self.width), dtype = np.uint32)
+		self.multipliers = get_hash_multipliers(depth, seed)
+	
+	def get_columns(self, codes, row):
+		return hash_codes(codes, self.multipliers[row], self.shift)
+	
+	def add(self, codes, counts):
+		"""
+		Args
+			codes (np.array): distinct kmer codes
+			counts (np.array): occurrences of each code
+		"""
+		for row in range(len(self.table)):
+			np.add.at(self.table[row], self.get_columns(codes, row), 
+				counts.astype(np.uint32))
+	
+	def query(self, codes):
+		"""
+		Returns np.array
+			estimated count of each code
+		"""
+		codes = np.asarray(codes)
+		estimates = np.full(len(codes), np.iinfo(np.uint32).max, dtype = np.uint32)
+		for row in range(len(self.table)):
+			np.minimum(estimates, 
+				self.table[row][self.get_columns(codes, row)], out = estimates)
+		return estimates.astype(np.int64)
+
+class BloomFilter:
+	"""
+	Set membership of kmer codes in a fixed amount of memory, with no
+	false negatives
+	Attributes
+		bits (np.array): bit array (uint8), a power of two bits long
+		multipliers (np.array): one hash_codes multiplier per hash function
+	"""
+	def __init__(self, memory_bytes, num_hashes = 4, seed = 1):
+		size_bits = max(3, int(math.log2(max(1, memory_bytes))) + 3)
+		self.bits = np.zeros(1 << (size_bits - 3), dtype = np.uint8)
+		self.shift = np.uint64(64 - size_bits)
+		self.multipliers = get_hash_multipliers(num_hashes, seed)
+	
+	def add(self, codes):
+		for multiplier in self.multipliers:
+			bit = hash_codes(codes, multiplier, self.shift)
+			np.bitwise_or.at(self.bits, bit >> np.uint64(3), 
+				(1 << (bit & np.uint64(7))).astype(np.uint8))
+	
+	def contains(self, codes):
+		"""
+		Returns np.array (bool)
+			True for codes that were (probably) added before
+		"""
+		found = np.ones(len(codes), dtype = bool)
+		for multiplier in self.multipliers:
+			bit = hash_codes(codes, multiplier, self.shift)
+			found &= (self.bits[bit >> np.uint64(3)] >> \
+				(bit & np.uint64(7)).astype(np.uint8)) & 1 == 1
+		return found
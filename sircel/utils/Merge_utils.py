@@ -0,0 +1,257 @@
+"""
+Akshay Tambe
+Pachter and Doudna groups
+
+Merge_utils.py
+10x genomics to dropseq conversion, without intermediate files
+	The cell barcode and UMI fastq files are read in lockstep, and their
+	records are combined on the fly (rather than written to a temp file):
+		cell barcode header
+		cell barcode sequence + UMI sequence
+		cell barcode '+' line
+		cell barcode quality + UMI quality
+	One pass over both inputs builds a record index (MergeIndex). A
+	MergedReader then presents the merged records as a seekable binary
+	stream, so the rest of the pipeline (record index, random and
+	sequential parsers, sharded workers) reads it like any fastq file
+"""
+import io
+import numpy as np
+
+from sircel.utils import IO_utils
+
+INDEX_BUFFER_SIZE = 2**24
+NAME_CHECK_SPACING = 10000
+SEQUENTIAL_RECORDS = 2**14
+RANDOM_RECORDS = 16
+
+_indices = {}
+
+class MergeIndex:
+	"""
+	Attributes
+		bc_fnames, umi_fnames (list): cell barcode and UMI fastq files
+		bc_starts, umi_starts (np.array): record start offsets in the
+			(decompressed) cell barcode and UMI streams
+		starts (np.array): record start offsets in the merged stream
+		size (int): total size of the merged stream
+	"""
+	def __init__(self, _bc_fnames, _umi_fnames, _threads = 1):
+		self.bc_fnames = list(_bc_fnames)
+		self.umi_fnames = list(_umi_fnames)
+		with IO_utils.open_fastq(self.bc_fnames, _threads) as fq:
+			(self.bc_starts, bc_end, _) = get_record_lengths(fq)
+		with IO_utils.open_fastq(self.umi_fnames, _threads) as fq:
+			(self.umi_starts, _, umi_lengths) = get_record_lengths(fq)
+		assert len(self.bc_starts) == len(self.umi_starts), \
+			'Barcode and UMI files have different numbers of reads\n%s\n%s' % \
+			(','.join(self.bc_fnames), ','.join(self.umi_fnames))
+
+		bc_lengths = np.diff(np.append(self.bc_starts, np.uint64(bc_end)))
+		lengths = bc_lengths.astype(np.int64) + umi_lengths
+		self.starts = np.zeros(len(lengths), dtype = np.uint64)
+		np.cumsum(lengths[0:-1], out = self.starts[1:])
+		self.size = int(lengths.sum())
+		self.check_names()
+
+	def get_num_records(self):
+		return len(self.starts)
+
+	def check_names(self):
+		"""
+		Checks that the read names of the two files agree, for every
+		NAME_CHECK_SPACING-th read and the last read
+		"""
+		num_records = self.get_num_records()
+		if num_records == 0:
+			return
+		records = np.append(
+			np.arange(0, num_records, NAME_CHECK_SPACING), num_records - 1)
+		get_prefix = lambda r: r[0].split(b' ')[0]
+		with IO_utils.open_fastq(self.bc_fnames) as bc_fq, \
+			IO_utils.open_fastq(self.umi_fnames) as umi_fq:
+			for (bc, umi) in zip(
+				IO_utils.read_fastq_random(bc_fq,
+					offsets = self.bc_starts[records[::-1]].tolist(),
+					decode = False),
+				IO_utils.read_fastq_random(umi_fq,
+					offsets = self.umi_starts[records[::-1]].tolist(),
+					decode = False)):
+				assert get_prefix(bc[0]) == get_prefix(umi[0]), \
+					'Reads are not in order\n%s\n%s' % \
+					(b'\n'.join(bc[0]).decode(), b'\n'.join(umi[0]).decode())
+
+def get_record_lengths(fq):
+	"""
+	Args
+		fq (file object): fastq opened in binary mode
+	Returns
+		record_starts (np.array): start offset of every record
+		size (int): size of the file
+		lengths (np.array): length of the sequence plus quality line of
+			every record, without carriage returns, which is what a UMI 
+			record adds to a merged record (see merge_lines)
+
+	Newlines are found in bulk, a buffer at a time, as in
+	IO_utils.build_record_index
+	"""
+	fq.seek(0)
+	record_starts = []
+	lengths = []
+	line_ends = np.zeros(0, dtype = np.int64)
+		#ends of the lines of the current, incomplete record
+	is_crlf = np.zeros(0, dtype = np.int64)
+		#1 for the lines that end with a carriage return
+	offset = 0
+	last_byte = b'\n'
+	at_eof = False
+	while not at_eof:
+		data = fq.read(INDEX_BUFFER_SIZE)
+		at_eof = len(data) == 0
+		if at_eof and last_byte != b'\n':
+			data = b'\n'#merged records always end with a newline
+		data_array = np.frombuffer(last_byte + data, dtype = np.uint8)
+			#with the byte before the buffer, for carriage returns
+		if len(data) > 0:
+			last_byte = data[-1:]
+		buffer_line_ends = np.flatnonzero(data_array[1:] == ord('\n')) + 1
+		line_ends = np.concatenate((line_ends, buffer_line_ends - 1 + offset))
+		is_crlf = np.concatenate((is_crlf,
+			(data_array[buffer_line_ends - 1] == ord('\r')).astype(np.int64)))
+		offset += len(data)
+		num_records = len(line_ends) // 4
+		record_line_ends = line_ends[0:4 * num_records].reshape(num_records, 4)
+		record_crlf = is_crlf[0:4 * num_records].reshape(num_records, 4)
+		line_ends = line_ends[4 * num_records:]
+		is_crlf = is_crlf[4 * num_records:]
+
+		record_starts.append(record_line_ends[:, 3] + 1)
+		lengths.append(
+			(record_line_ends[:, 1] - record_line_ends[:, 0] - 1) + \
+			(record_line_ends[:, 3] - record_line_ends[:, 2] - 1) - \
+			record_crlf[:, 1] - record_crlf[:, 3])
+	assert len(line_ends) == 0, 'Incomplete fastq record at end of file'
+
+	record_starts = np.concatenate(
+		[np.zeros(1, dtype = np.int64)] + record_starts)[0:-1]
+	lengths = np.concatenate([np.zeros(0, dtype = np.int64)] + lengths)
+	return record_starts.astype(np.uint64), offset, lengths
+
+def get_index(bc_fnames, umi_fnames, threads = 1):
+	"""
+	Returns the MergeIndex for the pair of file lists, building it on
+	first use (decompressing with threads). Cached per process, as 
+	Gzip_utils.get_index
+	"""
+	key = (tuple(bc_fnames), tuple(umi_fnames))
+	if key not in _indices:
+		_indices[key] = MergeIndex(bc_fnames, umi_fnames, threads)
+	return _indices[key]
+
+def read_records(fq, record_starts, first_record, last_record):
+	"""
+	Returns list
+		lines of records first_record ... last_record - 1
+	"""
+	fq.seek(int(record_starts[first_record]))
+	if last_record < len(record_starts):
+		data = fq.read(int(record_starts[last_record]) - \
+			int(record_starts[first_record]))
+	else:
+		data = fq.read()
+	return data.split(b'\n')
+
+def merge_lines(bc_line, umi_line):
+	"""
+	Returns bytes
+		the cell barcode line followed by the UMI line. Carriage returns
+		(CRLF files) are moved past the UMI, where parsers strip them, so
+		that the merged sequence has the barcode and UMI coordinates
+	"""
+	umi_line = umi_line.rstrip(b'\r')
+	if bc_line.endswith(b'\r'):
+		return bc_line[0:-1] + umi_line + b'\r'
+	return bc_line + umi_line
+
+class MergedReader(io.RawIOBase):
+	"""
+	Seekable, read-only raw stream over the merged records of a
+	MergeIndex. Wrap in io.BufferedReader for line iteration
+		Records are merged a window at a time: SEQUENTIAL_RECORDS when
+		reading on from the end of the last window, otherwise
+		RANDOM_RECORDS
+	"""
+	def __init__(self, _index, _threads = 1):
+		self.index = _index
+		self.pos = 0
+		self.bc_fq = IO_utils.open_fastq(self.index.bc_fnames, _threads)
+		self.umi_fq = IO_utils.open_fastq(self.index.umi_fnames, _threads)
+		self.window = b''
+		self.window_start = 0
+
+	def readable(self):
+		return True
+
+	def seekable(self):
+		return True
+
+	def tell(self):
+		return self.pos
+
+	def seek(self, pos, whence = io.SEEK_SET):
+		if whence == io.SEEK_CUR:
+			pos += self.pos
+		elif whence == io.SEEK_END:
+			pos += self.index.size
+		if pos < 0:
+			raise ValueError('Negative seek position %i' % pos)
+		self.pos = pos
+		return self.pos
+
+	def readinto(self, buf):
+		if self.pos >= self.index.size:
+			return 0
+		window_end = self.window_start + len(self.window)
+		if not (self.window_start <= self.pos < window_end):
+			if self.pos == window_end:
+				num_records = SEQUENTIAL_RECORDS
+			else:
+				num_records = RANDOM_RECORDS
+			self.merge_window(self.pos, num_records)
+		start = self.pos - self.window_start
+		num_bytes = min(len(buf), len(self.window) - start)
+		buf[0:num_bytes] = self.window[start:start + num_bytes]
+		self.pos += num_bytes
+		return num_bytes
+
+	def merge_window(self, pos, num_records):
+		"""
+		Merges num_records records, starting from the one that contains pos
+		"""
+		first_record = int(np.searchsorted(
+			self.index.starts, np.uint64(pos), side = 'right')) - 1
+		last_record = min(
+			first_record + num_records, self.index.get_num_records())
+		bc_lines = read_records(
+			self.bc_fq, self.index.bc_starts, first_record, last_record)
+		umi_lines = read_records(
+			self.umi_fq, self.index.umi_starts, first_record, last_record)
+
+		merged = []
+		num_lines = 4 * (last_record - first_record)
+		for i in range(0, num_lines, 4):
+			merged += [
+				bc_lines[i],
+				merge_lines(bc_lines[i + 1], umi_lines[i + 1]),
+				bc_lines[i + 2],
+				merge_lines(bc_lines[i + 3], umi_lines[i + 3])]
+		merged.append(b'')
+		self.window = b'\n'.join(merged)
+		self.window_start = int(self.index.starts[first_record])
+
+	def close(self):
+		if not self.closed:
+			self.bc_fq.close()
+			self.umi_fq.close()
+			self.window = b''
+		super().close()
@@ -35,13 +35,9 @@ def run_naive_pipeline(barcodes, reads, output_dir):
 	args['umi_end'] 			= 20
 	args['threads'] 			= 4
 	
-	print('Unzipping files (temporary)')
-	reads_unzipped = \
-		IO_utils.unzip(args['reads'].split(','))
-	barcodes_unzipped = \
-		IO_utils.unzip(args['barcodes'].split(','))
-	args['reads'] = reads_unzipped
-	args['barcodes'] = barcodes_unzipped
+	#gzipped inputs are read in place (see IO_utils.open_fastq)
+	reads_unzipped = args['reads']
+	barcodes_unzipped = args['barcodes']
 	
 	print('Counting kmers')
 	kmer_counts = count_kmers(
@@ -87,7 +83,7 @@ def count_kmers(barcodes_unzipped, barcode_start, barcode_end):
 	read_count = 0
 	kmer_counts = {}
 	
-	barcodes_f = open(barcodes_unzipped, 'rb')
+	barcodes_f = IO_utils.open_fastq(barcodes_unzipped)
 	for (chunk_num, reads_chunk) in enumerate(
 		IO_utils.get_read_chunks(
 			barcodes_f,
@@ -163,8 +159,8 @@ def assign_all_reads(params):
 	read_count = 0
 	num_unassigned = 0	
 	
-	reads_f = open(reads_unzipped, 'rb')
-	barcodes_f = open(barcodes_unzipped, 'rb')
+	reads_f = IO_utils.open_fastq(reads_unzipped)
+	barcodes_f = IO_utils.open_fastq(barcodes_unzipped)
 	
 	for reads_chunk, barcodes_chunk in zip(
 		IO_utils.get_read_chunks(
@@ -244,8 +240,8 @@ def write_split_fastqs(params):
 		barcodes_writer = gzip.open(output_files[cell_name]['barcodes'], 'wb')
 		umi_writer = open(output_files[cell_name]['umi'], 'wb')
 		
-		reads_f = open(reads_unzipped, 'rb')
-		barcodes_f = open(barcodes_unzipped, 'rb')
+		reads_f = IO_utils.open_fastq(reads_unzipped)
+		barcodes_f = IO_utils.open_fastq(barcodes_unzipped)
 		
 		reads_iter = IO_utils.read_fastq_random(
 			reads_f, 